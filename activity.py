@@ -0,0 +1,231 @@
+"""
+User activity: monthly cohorts, retention, churn and trip frequency.
+Users and months are integer codes and the activity of all users is one sparse
+user x month matrix (trips per user and month), stored as sorted coordinate arrays.
+Cohort tables and retention curves are bincounts over its non-zero entries, so no
+Python loop runs per user. The matrix can be saved, loaded and extended by new months.
+"""
+
+import os
+from pathlib import Path
+
+import numpy
+import pandas
+
+
+def _period(month):
+    """Period of a month ordinal (months since 1970-01)"""
+    return pandas.Period(year=1970 + int(month) // 12, month=int(month) % 12 + 1, freq='M')
+
+
+def _periods(first, count):
+    return pandas.PeriodIndex([_period(m) for m in range(first, first + count)], name="month")
+
+
+class UserActivity:
+    """
+    Sparse user x month activity matrix.
+      user_ids     sorted user IDs, the position is the user code
+      user_types   user_type of the latest trip of every user
+      last_trip    start time (datetime64[ns] as int64) of that trip, decides merges
+      user, month, trips   non-zero entries sorted by (user, month); month is the
+                           number of months since 1970-01
+    """
+
+    def __init__(self, user_ids, user_types, last_trip, user, month, trips):
+        self.user_ids = user_ids
+        self.user_types = user_types
+        self.last_trip = last_trip
+        self.user = user
+        self.month = month
+        self.trips = trips
+
+    @classmethod
+    def from_trips(cls, trips):
+        """Builds the matrix in one pass (trips without a start time are left out)"""
+        start = trips['start_time'].to_numpy(dtype='datetime64[ns]')
+        valid = ~numpy.isnat(start)
+        start = start[valid]
+        user_ids, codes = numpy.unique(trips['user_id'].to_numpy()[valid], return_inverse=True)
+        months = start.astype('datetime64[M]').astype(numpy.int64)
+
+        # latest trip of every user: sort by user, then time, and keep the last row per user
+        times = start.astype(numpy.int64)
+        order = numpy.lexsort((times, codes))
+        last = order[numpy.r_[codes[order][1:] != codes[order][:-1], True]] if len(order) else order
+        user_types = trips['user_type'].astype(object).to_numpy()[valid][last]
+
+        return cls._from_entries(user_ids, user_types, times[last], codes, months,
+                                 numpy.ones(len(codes), dtype=numpy.int64))
+
+    @classmethod
+    def _from_entries(cls, user_ids, user_types, last_trip, user, month, trips):
+        """Sums (possibly repeated) entries into sorted unique (user, month) cells"""
+        if not len(user):
+            empty = numpy.empty(0, dtype=numpy.int64)
+            return cls(user_ids, user_types, last_trip, empty, empty, empty)
+        first = int(month.min())
+        span = int(month.max()) - first + 1
+        keys, inverse = numpy.unique(user.astype(numpy.int64) * span + (month - first), return_inverse=True)
+        counts = numpy.bincount(inverse, weights=trips, minlength=len(keys)).astype(numpy.int64)
+        return cls(user_ids, user_types, last_trip, keys // span, keys % span + first, counts)
+
+    def extend(self, trips):
+        """
+        Adds new trips (e.g. the trips of a new month) and returns the extended matrix.
+        Only the new trips are read, the existing entries are merged in vectorised form.
+        """
+        new = trips if isinstance(trips, UserActivity) else UserActivity.from_trips(trips)
+        user_ids = numpy.union1d(self.user_ids, new.user_ids)
+        old_codes = numpy.searchsorted(user_ids, self.user_ids)
+        new_codes = numpy.searchsorted(user_ids, new.user_ids)
+
+        # user type of the later trip wins, equal times keep the new one
+        user_types = numpy.empty(len(user_ids), dtype=object)
+        last_trip = numpy.full(len(user_ids), numpy.iinfo(numpy.int64).min, dtype=numpy.int64)
+        user_types[old_codes] = self.user_types
+        last_trip[old_codes] = self.last_trip
+        later = new.last_trip >= last_trip[new_codes]
+        user_types[new_codes[later]] = new.user_types[later]
+        last_trip[new_codes[later]] = new.last_trip[later]
+
+        return self._from_entries(
+            user_ids, user_types, last_trip,
+            numpy.concatenate([old_codes[self.user], new_codes[new.user]]),
+            numpy.concatenate([self.month, new.month]),
+            numpy.concatenate([self.trips, new.trips]))
+
+    def save(self, path):
+        """Writes the matrix as one .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.stem + '.tmp.npz')
+        numpy.savez(tmp_path, user_ids=self.user_ids, user_types=self.user_types.astype(str),
+                    last_trip=self.last_trip, user=self.user, month=self.month, trips=self.trips)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as data:
+            return cls(data['user_ids'], data['user_types'].astype(object), data['last_trip'],
+                       data['user'], data['month'], data['trips'])
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    # --- analytics ---
+
+    def _entries(self, user_type=None):
+        """Entry arrays of all users or of the users of one user_type"""
+        if user_type is None:
+            return self.user, self.month, self.trips
+        keep = (self.user_types == user_type)[self.user]
+        return self.user[keep], self.month[keep], self.trips[keep]
+
+    def first_months(self):
+        """Cohort (first active month) of every user code; entries are sorted, so it is the first entry"""
+        first = numpy.full(len(self.user_ids), -1, dtype=numpy.int64)
+        starts = numpy.r_[True, self.user[1:] != self.user[:-1]] if len(self.user) else numpy.empty(0, dtype=bool)
+        first[self.user[starts]] = self.month[starts]
+        return first
+
+    def cohort_table(self, user_type=None):
+        """
+        Active users per cohort (rows, first active month) and months since the first month
+        (columns 0, 1, 2, ...). Column 0 is the cohort size.
+        """
+        user, month, _ = self._entries(user_type)
+        if not len(user):
+            return pandas.DataFrame()
+        cohorts = self.first_months()[user]
+        first, last = int(self.month.min()), int(self.month.max())
+        span = last - first + 1
+        cells = numpy.bincount((cohorts - first) * span + (month - cohorts), minlength=span * span)
+        table = pandas.DataFrame(cells.reshape(span, span), index=_periods(first, span))
+        table.index.name = "cohort"
+        table.columns.name = "months_since_first"
+        # cohorts without users and ages after the last month are not shown
+        table = table[table[0] > 0]
+        return table.loc[:, :int(last - self.first_months()[user].min())]
+
+    def retention(self, user_type=None):
+        """Share of every cohort that is active N months after its first month (NaN = not observed yet)"""
+        table = self.cohort_table(user_type)
+        if table.empty:
+            return table
+        rates = table.div(table[0], axis=0).astype(float)
+        # ages that lie after the last month of the data are unknown, not 0
+        last = int(self.month.max())
+        ages = numpy.arange(rates.shape[1])
+        cohorts = rates.index.asi8
+        rates = rates.where(cohorts[:, None] + ages[None, :] <= last)
+        return rates
+
+    def retention_curve(self, user_type=None):
+        """Retention by months since the first month over all cohorts, weighted by cohort size"""
+        table = self.cohort_table(user_type)
+        if table.empty:
+            return pandas.Series(dtype=float)
+        rates = self.retention(user_type)
+        sizes = table[0].to_numpy(dtype=float)
+        observed = rates.notna().to_numpy()
+        active = numpy.where(observed, table.to_numpy(), 0).sum(axis=0)
+        base = (observed * sizes[:, None]).sum(axis=0)
+        return pandas.Series(active / base, index=pandas.RangeIndex(len(active), name="months_since_first"))
+
+    def churn(self, user_type=None):
+        """
+        Per month: active users, new users (first month), users that are not active in the
+        next month (churned) and the churn rate. The last month has no next month and is left out.
+        """
+        user, month, _ = self._entries(user_type)
+        if not len(user):
+            return pandas.DataFrame(columns=["active", "new", "churned", "churn_rate"])
+        first, last = int(self.month.min()), int(self.month.max())
+        span = last - first + 1
+        # entries are sorted by (user, month): the user is back next month if the next entry says so
+        back = numpy.zeros(len(user), dtype=bool)
+        back[:-1] = (user[1:] == user[:-1]) & (month[1:] == month[:-1] + 1)
+        is_new = month == self.first_months()[user]
+
+        active = numpy.bincount(month - first, minlength=span)
+        frame = pandas.DataFrame({
+            "active": active,
+            "new": numpy.bincount(month - first, weights=is_new, minlength=span).astype(numpy.int64),
+            "churned": numpy.bincount(month - first, weights=~back, minlength=span).astype(numpy.int64),
+        }, index=_periods(first, span))
+        frame = frame.iloc[:-1]
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            frame["churn_rate"] = frame["churned"] / frame["active"]
+        return frame
+
+    def frequency(self, user_type=None, per='user'):
+        """
+        Number of users by trip count: trips per user over the whole time (per='user')
+        or trips per user and active month (per='month')
+        """
+        user, _, trips = self._entries(user_type)
+        if per == 'user':
+            trips = numpy.bincount(user, weights=trips, minlength=len(self.user_ids)).astype(numpy.int64)
+            trips = trips[trips > 0]
+        elif per != 'month':
+            raise ValueError(f"Unknown frequency period: {per}")
+        counts = numpy.bincount(trips)
+        found = numpy.flatnonzero(counts)
+        return pandas.Series(counts[found], index=pandas.Index(found, name="trips"), name="users")
+
+    def summary(self):
+        """One row per user_type: users, trips per user, month-1 retention and average churn rate"""
+        rows = {}
+        for user_type in sorted(set(self.user_types)):
+            user, _, trips = self._entries(user_type)
+            curve = self.retention_curve(user_type)
+            churn = self.churn(user_type)
+            users = len(numpy.unique(user))
+            rows[user_type] = {
+                "users": users,
+                "trips_per_user": trips.sum() / users if users else numpy.nan,
+                "retention_month_1": curve.iloc[1] if len(curve) > 1 else numpy.nan,
+                "churn_rate": churn["churned"].sum() / churn["active"].sum() if churn["active"].sum() else numpy.nan,
+            }
+        return pandas.DataFrame.from_dict(rows, orient="index")
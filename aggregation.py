@@ -0,0 +1,227 @@
+"""
+Aggregation engine for the business report.
+All trip metrics are collected in a few grouped passes into mergeable partial aggregates,
+the final statistics are derived from these small tables only.
+"""
+
+import calendar
+
+import numpy
+import pandas
+
+from numerical import StreamingStats
+from pricing import PLANS, UNPRICED, PricingEngine
+
+HOURS_PER_WEEK = 24 * 7
+
+
+def top_counts(counts, n):
+    """
+    Largest 'n' counts, ties are ordered by key, so the result does not depend
+    on the row order and merged aggregates give the same answer.
+    """
+    counts = counts.sort_index(kind='stable').sort_values(ascending=False, kind='stable')
+    return counts.head(n)
+
+
+def time_keys(start_times):
+    """
+    Derives month, weekday and hour of every start time in one numpy pass and packs them
+    into a single int64 key: (month * 7 + weekday) * 24 + hour.
+    The month is the number of months since 1970-01 (the pandas Period ordinal).
+    Returns the keys of all valid (not NaT) times.
+    """
+    values = start_times.to_numpy(dtype='datetime64[ns]')
+    values = values[~numpy.isnat(values)]
+
+    days = values.astype('datetime64[D]')
+    months = values.astype('datetime64[M]').astype(numpy.int64)
+    hours = (values - days).astype('timedelta64[h]').astype(numpy.int64)
+    # 1970-01-01 was a Thursday (weekday 3)
+    weekdays = (days.astype(numpy.int64) + 3) % 7
+
+    return (months * 7 + weekdays) * 24 + hours
+
+
+class TripAggregates:
+    """
+    Mergeable partial aggregates of a trips frame.
+    Two aggregates of different parts of the data can be combined with merge(),
+    the result is the same as aggregating all the data at once.
+    """
+
+    def __init__(self):
+        self.trip_count = 0
+        self.distance_sum = 0.0
+        self.distance_count = 0
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.min_start = pandas.NaT
+        self.max_end = pandas.NaT
+        # (start_station_id, end_station_id) -> trips
+        self.routes = pandas.Series(dtype='int64')
+        # (user_type, user_id) -> trips, distance_sum, distance_count
+        self.users = pandas.DataFrame(columns=['trips', 'distance_sum', 'distance_count'])
+        # packed month/weekday/hour key (see time_keys) -> trips
+        self.time_slots = pandas.Series(dtype='int64')
+        # weekday -> sequence number of its first trip, breaks ties of busiest_day() like
+        # value_counts().idxmax() (the day that comes first in the data wins)
+        self.weekday_first = pandas.Series(dtype='int64')
+        # bike_id -> bike_type of the last trip of that bike
+        self.bikes = pandas.Series(dtype='object')
+        # bike_id -> sequence number (row position) of that last trip, used by merge()
+        self.bike_seq = pandas.Series(dtype='int64')
+        # bike_type -> trips
+        self.bike_type_trips = pandas.Series(dtype='int64')
+        # distance_km distribution (mergeable t-digest) for the box plot
+        self.distance_stats = StreamingStats()
+        # revenue and trips per plan code (see pricing.PLANS) under the standard tariff,
+        # the last entry (pricing.UNPRICED) holds the trips of unknown user types
+        self.revenue = numpy.zeros(UNPRICED + 1)
+        self.plan_trips = numpy.zeros(UNPRICED + 1, dtype=numpy.int64)
+
+    @classmethod
+    def from_trips(cls, trips, positions=None, tiers=None):
+        """
+        Aggregates a trips frame, every groupby computes several metrics at once.
+        'positions' are the sequence numbers of the rows in the whole dataset
+        (default 0..len-1); they decide which bike_type wins when partial aggregates of
+        non-contiguous parts (e.g. months) are merged.
+        'tiers' (user_id -> 'basic'/'premium') prices members with their tier, see PricingEngine.
+        """
+        agg = cls()
+        if trips.empty:
+            return agg
+
+        agg.trip_count = len(trips)
+        agg.distance_sum = float(trips['distance_km'].sum())
+        agg.distance_count = int(trips['distance_km'].count())
+
+        if 'duration_minutes' in trips.columns:
+            duration = trips['duration_minutes']
+        else:
+            duration = (trips['end_time'] - trips['start_time']).dt.total_seconds() / 60
+        agg.duration_sum = float(duration.sum())
+        agg.duration_count = int(duration.count())
+
+        agg.min_start = trips['start_time'].min()
+        agg.max_end = trips['end_time'].max()
+
+        # routes also give the start and end station counts
+        agg.routes = trips.groupby(['start_station_id', 'end_station_id'], observed=True).size()
+
+        # user counts give the top users, the avg distance and the avg trips per user type
+        agg.users = trips.groupby(['user_type', 'user_id'], observed=True).agg(
+            trips=('distance_km', 'size'),
+            distance_sum=('distance_km', 'sum'),
+            distance_count=('distance_km', 'count'),
+        )
+
+        if positions is None:
+            positions = numpy.arange(len(trips))
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+
+        # month, weekday and hour in a single key and a single count
+        keys = time_keys(trips['start_time'])
+        if keys.size:
+            first_key = keys.min()
+            slot_counts = numpy.bincount(keys - first_key)
+            slots = numpy.flatnonzero(slot_counts)
+            agg.time_slots = pandas.Series(slot_counts[slots], index=slots + first_key, dtype='int64')
+            valid = trips['start_time'].notna().to_numpy()
+            agg.weekday_first = pandas.Series(positions[valid]).groupby((keys // 24) % 7).min()
+
+        # last seen bike type per bike (also gives the number of unique bikes)
+        is_last = ~trips['bike_id'].duplicated(keep='last').to_numpy()
+        bike_ids = trips['bike_id'].to_numpy()[is_last]
+        agg.bikes = pandas.Series(trips['bike_type'].astype(object).to_numpy()[is_last], index=bike_ids)
+        agg.bike_seq = pandas.Series(positions[is_last], index=bike_ids)
+
+        bike_types = trips['bike_type'].value_counts()
+        bike_types = bike_types[bike_types > 0]
+        agg.bike_type_trips = pandas.Series(bike_types.to_numpy(dtype='int64'), index=bike_types.index.astype(str))
+        agg.distance_stats = StreamingStats().update(trips['distance_km'])
+
+        agg.revenue, agg.plan_trips = PricingEngine(tiers).plan_revenue(trips)
+        return agg
+
+    def merge(self, other):
+        """
+        Combines two aggregates. For the bike types the higher sequence number wins,
+        on equal numbers 'other' is treated as the later part of the data.
+        """
+        merged = TripAggregates()
+        merged.trip_count = self.trip_count + other.trip_count
+        merged.distance_sum = self.distance_sum + other.distance_sum
+        merged.distance_count = self.distance_count + other.distance_count
+        merged.duration_sum = self.duration_sum + other.duration_sum
+        merged.duration_count = self.duration_count + other.duration_count
+        merged.min_start = min((t for t in (self.min_start, other.min_start) if not pandas.isna(t)), default=pandas.NaT)
+        merged.max_end = max((t for t in (self.max_end, other.max_end) if not pandas.isna(t)), default=pandas.NaT)
+
+        merged.routes = _add_counts(self.routes, other.routes)
+        merged.time_slots = _add_counts(self.time_slots, other.time_slots)
+        merged.weekday_first = pandas.concat([self.weekday_first, other.weekday_first]).groupby(level=0).min()
+        if self.users.empty or other.users.empty:
+            merged.users = other.users if self.users.empty else self.users
+        else:
+            merged.users = self.users.add(other.users, fill_value=0).astype(self.users.dtypes).sort_index()
+
+        bikes = pandas.concat([self.bikes, other.bikes])
+        bike_seq = pandas.concat([self.bike_seq, other.bike_seq])
+        order = numpy.argsort(bike_seq.to_numpy(), kind='stable')
+        bikes = bikes.iloc[order]
+        keep = ~bikes.index.duplicated(keep='last')
+        merged.bikes = bikes[keep]
+        merged.bike_seq = bike_seq.iloc[order][keep]
+        merged.bike_type_trips = _add_counts(self.bike_type_trips, other.bike_type_trips)
+        merged.distance_stats = self.distance_stats.merge(other.distance_stats)
+        merged.revenue = self.revenue + other.revenue
+        merged.plan_trips = self.plan_trips + other.plan_trips
+        return merged
+
+    # --- derived metrics ---
+
+    def station_counts(self, level):
+        """Trips per start (level=0) or end (level=1) station"""
+        return self.routes.groupby(level=level).sum()
+
+    def hour_counts(self):
+        return self.time_slots.groupby(self.time_slots.index % 24).sum()
+
+    def weekday_counts(self):
+        return self.time_slots.groupby((self.time_slots.index // 24) % 7).sum()
+
+    def month_counts(self):
+        months = self.time_slots.groupby(self.time_slots.index // HOURS_PER_WEEK).sum()
+        return {
+            pandas.Period(year=1970 + m // 12, month=m % 12 + 1, freq='M'): int(count)
+            for m, count in months.sort_index().items()
+        }
+
+    def peak_hour(self):
+        hours = self.hour_counts()
+        # like Series.mode()[0]: the smallest hour with the highest count
+        return int(hours[hours == hours.max()].index.min())
+
+    def revenue_by_plan(self):
+        """{plan: revenue}, plans without trips (e.g. 'premium' when no tiers are known) are left out"""
+        return {plan: float(self.revenue[code]) for code, plan in enumerate(PLANS) if self.plan_trips[code]}
+
+    def unpriced_trips(self):
+        """Trips that are not in revenue_by_plan because their user_type is unknown"""
+        return int(self.plan_trips[UNPRICED])
+
+    def busiest_day(self):
+        days = self.weekday_counts()
+        # like value_counts().idxmax(): of the days with the highest count, the first one in the data
+        tied = days[days == days.max()].index
+        return calendar.day_name[int(self.weekday_first.loc[tied].idxmin())]
+
+
+def _add_counts(left, right):
+    if left.empty:
+        return right
+    if right.empty:
+        return left
+    return left.add(right, fill_value=0).astype('int64')
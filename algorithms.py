@@ -1,9 +1,14 @@
+import numpy as np
+
+from metrics import timed
+
 class Algorithms:
     """
     Provides custom implementations of fundamental algorithms.
     """
 
     @staticmethod
+    @timed("merge_sort")
     def merge_sort(arr, key_func=lambda x: x):
         """
         Sorts a list using the Merge Sort algorithm (Divide and Conquer).
@@ -16,6 +21,10 @@ class Algorithms:
         Returns:
             list: A new sorted list.
         """
+        return Algorithms._merge_sort(arr, key_func)
+
+    @staticmethod
+    def _merge_sort(arr, key_func):
         # Base case: if list has 0 or 1 element, it is already sorted
         if len(arr) <= 1:
             return arr
@@ -24,8 +33,8 @@ class Algorithms:
         mid = len(arr) // 2
         
         # Conquer: Recursively sort both halves
-        left_half = Algorithms.merge_sort(arr[:mid], key_func)
-        right_half = Algorithms.merge_sort(arr[mid:], key_func)
+        left_half = Algorithms._merge_sort(arr[:mid], key_func)
+        right_half = Algorithms._merge_sort(arr[mid:], key_func)
 
         # Combine: Merge the sorted halves back together
         return Algorithms._merge(left_half, right_half, key_func)
@@ -53,6 +62,113 @@ class Algorithms:
         
         return result
 
+    @staticmethod
+    @timed("merge_sort_bottom_up")
+    def merge_sort_bottom_up(arr, key_func=lambda x: x):
+        """
+        Iterative (bottom-up) Merge Sort for large lists.
+        - every key is computed only once (decorate-sort-undecorate)
+        - no slicing and no recursion, one auxiliary buffer is reused for all passes
+        - already sorted parts of the input (natural runs) are used as starting runs,
+          so sorted or almost sorted data needs only a few passes
+        The sort is stable, like merge_sort.
+
+        Args:
+            arr (list): The list of elements to be sorted.
+            key_func (callable): Extracts the comparison key from each element.
+
+        Returns:
+            list: A new sorted list.
+        """
+        n = len(arr)
+        if n <= 1:
+            return list(arr)
+
+        # Decorate: compute each key once
+        keys = [key_func(x) for x in arr]
+        order = list(range(n))
+
+        # Find natural runs: non-descending parts of the input
+        bounds = [0]
+        for i in range(1, n):
+            if keys[i] < keys[i - 1]:
+                bounds.append(i)
+        bounds.append(n)
+
+        src, dst = order, [0] * n
+        while len(bounds) > 2:
+            merged_bounds = [0]
+            # Merge neighbour runs [lo, mid) and [mid, hi) from src into dst
+            for r in range(0, len(bounds) - 1, 2):
+                lo = bounds[r]
+                mid = bounds[r + 1]
+                hi = bounds[r + 2] if r + 2 < len(bounds) else mid
+                Algorithms._merge_runs(src, dst, keys, lo, mid, hi)
+                merged_bounds.append(hi)
+            bounds = merged_bounds
+            src, dst = dst, src
+
+        # Undecorate
+        return [arr[i] for i in src]
+
+    @staticmethod
+    def _merge_runs(src, dst, keys, lo, mid, hi):
+        """
+        Helper for merge_sort_bottom_up: merges the sorted index runs src[lo:mid]
+        and src[mid:hi] into dst[lo:hi], comparing the precomputed keys.
+        """
+        i, j, k = lo, mid, lo
+        while i < mid and j < hi:
+            # '<=' keeps equal elements in their original order (stable)
+            if keys[src[i]] <= keys[src[j]]:
+                dst[k] = src[i]
+                i += 1
+            else:
+                dst[k] = src[j]
+                j += 1
+            k += 1
+        # Copy the rest of the run that is not finished yet
+        dst[k:k + mid - i] = src[i:mid]
+        k += mid - i
+        dst[k:k + hi - j] = src[j:hi]
+
+    @staticmethod
+    def argsort(values, descending=False):
+        """
+        NumPy path for large inputs (e.g. a DataFrame column with 10M+ trips).
+        Returns the indices that sort 'values', using NumPy's stable merge/radix sort.
+        Missing values (NaN/NaT) are placed at the end.
+
+        Args:
+            values: A NumPy array or pandas Series of numbers or datetimes.
+            descending (bool): Sort from the largest to the smallest value.
+
+        Returns:
+            numpy.ndarray: Positions of the values in sorted order.
+        """
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.datetime64) or np.issubdtype(values.dtype, np.timedelta64):
+            missing = np.isnat(values)
+            values = values.view(np.int64)
+        else:
+            missing = np.isnan(values) if np.issubdtype(values.dtype, np.floating) else None
+            if values.dtype.kind in 'ub':
+                # unsigned / bool values can not be negated for the descending order
+                values = values.astype(np.int64)
+
+        # negating keeps equal values in their original order (a reversed sort would not)
+        keys = -values if descending else values
+        order = np.argsort(keys, kind='stable')
+        if missing is not None and missing.any():
+            order = np.concatenate([order[~missing[order]], np.flatnonzero(missing)])
+        return order
+
+    @staticmethod
+    @timed("sort_frame")
+    def sort_frame(df, column, descending=False):
+        """Returns 'df' sorted by one column using Algorithms.argsort"""
+        return df.iloc[Algorithms.argsort(df[column].to_numpy(), descending)]
+
     @staticmethod
     def binary_search(arr, target, key_func=lambda x: x):
         """
@@ -74,4 +190,57 @@ class Algorithms:
                 high = mid - 1
         
         return None
-    
\ No newline at end of file
+    
+
+    @staticmethod
+    def lower_bound(keys, target):
+        """
+        Index of the first key that is >= target (like bisect_left).
+        'keys' is a pre-sorted list/array of keys, so no key function is called while probing.
+        """
+        low, high = 0, len(keys)
+        while low < high:
+            mid = (low + high) // 2
+            if keys[mid] < target:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    @staticmethod
+    def upper_bound(keys, target):
+        """Index of the first key that is > target (like bisect_right)."""
+        low, high = 0, len(keys)
+        while low < high:
+            mid = (low + high) // 2
+            if keys[mid] <= target:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    @staticmethod
+    def range_query(keys, low, high, include_high=True):
+        """
+        Positions of all keys in [low, high] (or [low, high) with include_high=False)
+        as a (start, stop) pair, keys[start:stop] is the result.
+        """
+        start = Algorithms.lower_bound(keys, low)
+        if include_high:
+            stop = Algorithms.upper_bound(keys, high)
+        else:
+            stop = Algorithms.lower_bound(keys, high)
+        return start, max(start, stop)
+
+    @staticmethod
+    def batch_range_query(keys, lows, highs, include_high=True):
+        """
+        range_query for many windows at once, vectorised with np.searchsorted.
+
+        Returns:
+            tuple: (starts, stops) arrays, one pair per window.
+        """
+        keys = np.asarray(keys)
+        starts = np.searchsorted(keys, np.asarray(lows), side='left')
+        stops = np.searchsorted(keys, np.asarray(highs), side='right' if include_high else 'left')
+        return starts, np.maximum(starts, stops)
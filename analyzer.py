@@ -6,8 +6,37 @@ import pandas
 import numpy
 from pathlib import Path
 
+from activity import UserActivity
+from cache import DataCache
+from cleaning import get_rules
+from cube import RollupCube
+from aggregation import TripAggregates, top_counts
+from fleet import FleetIndex
+from flow import StationFlow
+from incremental import IncrementalStats
+from metrics import METRICS, timed
+from od import ODMatrix
+from parallel import parallel_aggregates
+from registry import StationRegistry
+from timeindex import TripTimeIndex
+from schema import get_schema, read_dtypes, format_ids
+
 SOURCE_DATA_DIR = Path(__file__).resolve().parent / "data"
 OUTPUT_DATA_DIR = Path(__file__).resolve().parent / "output"
+# rows per chunk for the streaming (chunked) loading mode
+DEFAULT_CHUNK_SIZE = 100_000
+# columnar cache of the cleaned tables, bump the version whenever the cleaning rules change
+CACHE_DIR = OUTPUT_DATA_DIR / "cache"
+CLEANING_RULES_VERSION = 3
+# aggregate state of the incremental (append-only) mode
+INCREMENTAL_DIR = OUTPUT_DATA_DIR / "incremental"
+# keys of the generate_business_stats() dictionary, in report order
+BUSINESS_STATS = (
+    'total_trips', 'total_distance', 'avg_distance', 'avg_duration', 'top_10_start', 'top_10_end',
+    'peak_hour', 'busiest_day', 'avg_dist_by_user', 'utilization_rate', 'monthly_trend', 'top_users',
+    'maint_cost_by_type', 'total_maint_cost', 'top_routes', 'revenue_by_plan', 'unpriced_trips',
+    'avg_trips_per_user_type',
+)
 
 class BikeShare:
 
@@ -16,158 +45,446 @@ class BikeShare:
         self.stations = None
         self.trips = None
         self.maintenance = None
+        # member tiers (user_id -> 'basic'/'premium') for the revenue per plan, unknown by default
+        self.member_tiers = None
+        self._station_registry = None
+        self._time_index = None
+        self._fleet_index = None
+        self._fleet_sources = (None, None)
+        self._trip_aggregates = None
+        self._aggregates_sources = (None, None)
+        self._rollup_cube = None
+        self._cube_source = None
+        self._user_activity = None
+        self._activity_source = None
+        # rows removed per cleaning rule of the last load of every file: {file: {rule: rows}}
+        self.cleaning_report = {}
+
+    def load_and_clean_data(self, file_name, chunksize=None):
+        """
+        Loads a source CSV file and applies the cleaning rules.
+        If 'chunksize' is given the file is parsed and cleaned in chunks of that many rows
+        (see iter_clean_chunks). That only bounds the memory of parsing: the cleaned chunks
+        are still concatenated into one frame. Use iter_clean_chunks or stream_clean_data
+        to keep the memory independent of the file size.
+        """
+        if chunksize:
+            chunks = list(self.iter_clean_chunks(file_name, chunksize))
+            return pandas.concat(chunks, ignore_index=True) if chunks else pandas.DataFrame()
+
+        file_path = self._source_path(file_name)
+        schema = get_schema(file_name)
+        source = Path(file_name).name
+
+        with METRICS.timer("load_and_clean_data", file=source):
+            # get file data (files with a schema are read with their compact column types)
+            df = pandas.read_csv(file_path, dtype=read_dtypes(schema) if schema else None)
+            initial_count = len(df)
+
+            # removing duplicates
+            df = df.drop_duplicates()
+            METRICS.rule(source, "duplicates", initial_count, len(df))
+            self.cleaning_report[source] = {"duplicates": initial_count - len(df)}
+
+            df = self._clean_frame(df, schema, source=source)
+
+        print(f"File {file_name}: {initial_count} -> {len(df)} rows (Cleaned).")
+        return df
+
+    def iter_clean_chunks(self, file_name, chunksize=DEFAULT_CHUNK_SIZE):
+        """
+        Streaming version of load_and_clean_data.
+        Reads the file 'chunksize' rows at a time and yields every cleaned chunk,
+        so memory depends on the chunk size and not on the file size.
+        Duplicates are removed across chunks with sorted arrays of 64-bit row hashes
+        (8 bytes per distinct row, see _unique_chunks).
+        """
+        file_path = self._source_path(file_name)
+        schema = get_schema(file_name)
+        schema_dtypes = read_dtypes(schema) if schema else {}
+
+        # peek at the first rows to pin the column types for every chunk,
+        # otherwise a chunk where a text column is fully empty would be read as float
+        sample = pandas.read_csv(file_path, nrows=max(chunksize, DEFAULT_CHUNK_SIZE), dtype=schema_dtypes)
+        numeric_cols = list(sample.select_dtypes(include=['number']).columns)
+        text_cols = [col for col in sample.columns if col not in numeric_cols]
+        read_options = {"chunksize": chunksize, "dtype": {**{col: str for col in text_cols}, **schema_dtypes}}
+
+        # columns filled with the file average (e.g. battery_level) need one extra pass
+        source = Path(file_name).name
+        self.cleaning_report[source] = {"duplicates": 0}
+        fill_values = {}
+        mean_columns = [col for col in get_rules(source).mean_fills if col in sample.columns]
+        if mean_columns:
+            totals = pandas.Series(0.0, index=mean_columns)
+            counts = pandas.Series(0, index=mean_columns)
+            for _, chunk in self._unique_chunks(pandas.read_csv(file_path, **read_options)):
+                totals += chunk[mean_columns].sum()
+                counts += chunk[mean_columns].count()
+            fill_values = {col: totals[col] / counts[col] if counts[col] else numpy.nan for col in mean_columns}
+
+        initial_count = 0
+        cleaned_count = 0
+        reader = pandas.read_csv(file_path, **read_options)
+        for raw_rows, chunk in self._unique_chunks(reader):
+            initial_count += raw_rows
+            METRICS.rule(source, "duplicates", raw_rows, len(chunk))
+            self.cleaning_report[source]["duplicates"] += raw_rows - len(chunk)
+            with METRICS.timer("clean_chunk", file=source):
+                chunk = self._clean_frame(chunk, schema, fill_values, numeric_cols, text_cols, source)
+            cleaned_count += len(chunk)
+            yield chunk
+
+        print(f"File {file_name}: {initial_count} -> {cleaned_count} rows (Cleaned).")
 
-    def load_and_clean_data(self, file_name):
+    def stream_clean_data(self, file_name, output_file, chunksize=DEFAULT_CHUNK_SIZE):
+        """Cleans a source file chunk by chunk and appends the result to a CSV file"""
+        output_file = Path(output_file)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        header = True
+        with open(output_file, "w", newline="") as f:
+            for chunk in self.iter_clean_chunks(file_name, chunksize):
+                chunk.to_csv(f, index=False, header=header)
+                header = False
+        return output_file
+
+    def _source_path(self, file_name):
+        # an existing path (e.g. data/trips_2024-06-01.csv) is used as it is,
+        # a bare file name is looked up in the data directory
+        file_path = Path(file_name)
+        if not file_path.is_file():
+            file_path = SOURCE_DATA_DIR / file_name
 
-        file_path = SOURCE_DATA_DIR / file_name
-        
         if not file_path.exists():
             raise FileNotFoundError(f"File {file_name} not found in {SOURCE_DATA_DIR}")
+        return file_path
+
+    @staticmethod
+    def _unique_chunks(reader):
+        """
+        Drops rows that were already seen in this or an earlier chunk.
+        Keeps sorted numpy arrays of row hashes instead of the rows themselves: every chunk
+        adds one sorted run, and runs of similar size are merged (like a binary counter),
+        so there are O(log n) runs to search and every hash is merged O(log n) times.
+        Yields (raw row count, unique rows) for every chunk.
+        """
+        runs = []
+        for chunk in reader:
+            # numbers are hashed as float so 2 and 2.0 from different chunks are equal
+            key_frame = chunk.astype({col: 'float64' for col in chunk.select_dtypes(include=['number']).columns})
+            hashes = pandas.util.hash_pandas_object(key_frame, index=False).to_numpy()
+
+            # work on the sorted hashes: first occurrences are the rows with a new value, and
+            # searchsorted is much faster with sorted needles (sequential instead of random access)
+            order = numpy.argsort(hashes, kind='stable')
+            ordered = hashes[order]
+            new = numpy.r_[True, ordered[1:] != ordered[:-1]] if len(ordered) else numpy.empty(0, dtype=bool)
+            for run in runs:
+                pos = numpy.minimum(run.searchsorted(ordered), run.size - 1)
+                new &= run[pos] != ordered
+            keep = numpy.zeros(len(hashes), dtype=bool)
+            keep[order[new]] = True
 
-        # get file data
-        df = pandas.read_csv(file_path)
-        initial_count = len(df)
+            run = ordered[new]
+            while runs and runs[-1].size <= 2 * run.size:
+                run = numpy.sort(numpy.concatenate([runs.pop(), run]), kind='stable')
+            if run.size:
+                runs.append(run)
 
-        # removing duplicates
-        df = df.drop_duplicates()
+            yield len(chunk), chunk[keep]
+
+    def _clean_frame(self, df, schema=None, fill_values=None, numeric_cols=None, object_cols=None, source=None):
+        """
+        Applies the cleaning rules of 'source' (see cleaning.py) to an already de-duplicated frame.
+        'fill_values', 'numeric_cols' and 'object_cols' are used by the chunked mode,
+        where the averages and column types have to be the same for every chunk.
+        Rejected rows per rule are added to self.cleaning_report[source].
+        """
+        report = self.cleaning_report.setdefault(source, {}) if source else None
+        return get_rules(source).apply(df, schema, fill_values, numeric_cols, object_cols, source, report)
+    
+    def initialize_system(self, chunksize=None, use_cache=True):
+        """
+        Loading all main system source files.
+        'chunksize' switches trips.csv (the only big file) to the streaming mode.
+        With 'use_cache' the cleaned tables are read from / written to the columnar cache.
+        """
+        cache = DataCache(CACHE_DIR, CLEANING_RULES_VERSION) if use_cache else None
+        self.stations = self._load_cached("stations.csv", cache)
+        self.trips = self._load_cached("trips.csv", cache, chunksize=chunksize)
+        self.maintenance = self._load_cached("maintenance.csv", cache)
+        self._station_registry = StationRegistry(self.stations)
 
-        # search columns with name 'date' or 'time' and convert them to same type (datetime)
-        date_columns = [col for col in df.columns if 'date' in col or 'time' in col]
-        for col in date_columns:
-            df[col] = pandas.to_datetime(df[col], errors='coerce')
+    @property
+    def station_registry(self):
+        """ID index of self.stations, rebuilt only when the stations table is replaced"""
+        if self._station_registry is None or self._station_registry.stations is not self.stations:
+            self._station_registry = StationRegistry(self.stations)
+        return self._station_registry
 
-        # fill empty cost cells with 0
-        if 'cost' in df.columns:
-            df['cost'] = df['cost'].fillna(0)
+    @property
+    def time_index(self):
+        """start_time index of self.trips, built on first use and when the trips table is replaced"""
+        if self._time_index is None or self._time_index.df is not self.trips:
+            self._time_index = TripTimeIndex(self.trips)
+        return self._time_index
 
-        if 'battery_level' in df.columns:
-            # for ebikes set empty values with average values
-            avg_battery = df['battery_level'].mean()
-            df['battery_level'] = df['battery_level'].fillna(avg_battery)
+    @property
+    def fleet_index(self):
+        """Per-bike health index (FleetIndex), rebuilt only when trips or maintenance are replaced"""
+        trips, maintenance = self._fleet_sources
+        if self._fleet_index is None or trips is not self.trips or maintenance is not self.maintenance:
+            self._fleet_index = FleetIndex.build(self.trips, self.maintenance)
+            self._fleet_sources = (self.trips, self.maintenance)
+        return self._fleet_index
 
+    @property
+    def trip_aggregates(self):
+        """
+        TripAggregates of self.trips (report metrics and chart inputs), computed once and
+        again only when the trips table or the member tiers are replaced
+        """
+        trips, tiers = self._aggregates_sources
+        if self._trip_aggregates is None or trips is not self.trips or tiers is not self.member_tiers:
+            self._trip_aggregates = TripAggregates.from_trips(self.trips, tiers=self.member_tiers)
+            self._aggregates_sources = (self.trips, self.member_tiers)
+        return self._trip_aggregates
 
-        if 'distance_km' in df.columns:
-            # set positive values in case if there negative once
-            df = df[df['distance_km'] >= 0]
+    @property
+    def rollup_cube(self):
+        """
+        Trips rolled up by date x station x hour x user_type x bike_type (RollupCube, in memory),
+        rebuilt only when the trips table is replaced, e.g. rollup_cube.peak_hour(user_type='member')
+        """
+        if self._rollup_cube is None or self._cube_source is not self.trips:
+            self._rollup_cube = RollupCube.build(self.trips)
+            self._cube_source = self.trips
+        return self._rollup_cube
 
-        # 1. First fill numeric columns with 0
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        df[numeric_cols] = df[numeric_cols].fillna(0)
+    def incremental_cube(self, state_dir=INCREMENTAL_DIR):
+        """Memory-mapped rollup cube of the incremental state (see apply_trip_batch), None if there is none"""
+        return IncrementalStats(state_dir, CLEANING_RULES_VERSION).cube
 
-        # if there other empty cells - set there Unknown
-        object_cols = df.select_dtypes(include=['object']).columns
-        df[object_cols] = df[object_cols].fillna('Unknown')
+    @property
+    def user_activity(self):
+        """
+        Sparse user x month activity of the trips (UserActivity) for cohort, retention and churn
+        questions, rebuilt only when the trips table is replaced
+        """
+        if self._user_activity is None or self._activity_source is not self.trips:
+            self._user_activity = UserActivity.from_trips(self.trips)
+            self._activity_source = self.trips
+        return self._user_activity
 
-        # Validation: end_time must be after start_time
-        if 'start_time' in df.columns and 'end_time' in df.columns:
-            # keep only records where trip duration was > 0 sec
-            df = df[df['end_time'] > df['start_time']]
+    def incremental_activity(self, state_dir=INCREMENTAL_DIR):
+        """User activity of the incremental state (see apply_trip_batch), None if there is none"""
+        return IncrementalStats(state_dir, CLEANING_RULES_VERSION).activity
 
-        print(f"File {file_name}: {initial_count} -> {len(df)} rows (Cleaned).")
+    def bikes_due(self, km, maintenance_type=None):
+        """
+        Bikes that rode more than 'km' since their last maintenance, e.g.
+        bikes_due(500, 'brake_adjustment'). Most kilometres first.
+        """
+        return self.fleet_index.due(km, maintenance_type)
+
+    def trips_between(self, start, end, hours=None, weekdays=None):
+        """
+        Trips that started in [start, end), optionally only between hours=(from, to)
+        on the given weekdays (0 = Monday), e.g.
+            trips_between('2024-03-01', '2024-04-01', hours=(8, 9), weekdays=range(5))
+        Uses binary searches on the sorted time index instead of a full-table mask.
+        """
+        index = self.time_index
+        return index.select(index.query(start, end, hours, weekdays))
+
+    def _load_cached(self, file_name, cache, chunksize=None):
+        """Returns the cached cleaned table if the source file did not change, otherwise cleans it again"""
+        if cache is None or not cache.enabled:
+            return self.load_and_clean_data(file_name, chunksize=chunksize)
+
+        source_path = self._source_path(file_name)
+        with METRICS.timer("cache_load", file=file_name):
+            df = cache.load(file_name, source_path)
+        if df is not None:
+            print(f"File {file_name}: {len(df)} rows (Cache).")
+            return df
+
+        df = self.load_and_clean_data(file_name, chunksize=chunksize)
+        cache.save(file_name, source_path, df)
         return df
-    
-    def initialize_system(self):
-        """Loading all main system source files"""
-        self.stations = self.load_and_clean_data("stations.csv")
-        self.trips = self.load_and_clean_data("trips.csv")
-        self.maintenance = self.load_and_clean_data("maintenance.csv")
 
-    def generate_business_stats(self):
+    @timed("generate_business_stats")
+    def generate_business_stats(self, workers=1, partition_by='month', trips=None):
         """
         Analyzes the data to answer detailed business questions.
         Returns a dictionary with results.
+        All trip metrics come from one TripAggregates pass (see aggregation.py),
+        self.trips and self.maintenance are not modified.
+        With workers > 1 the trips are aggregated per month (or per row shard with
+        partition_by='rows') in a process pool and the partial results are merged; that only
+        helps for millions of trips on several CPUs, smaller tables run serially (see parallel.py).
+        'trips' answers the questions for a subset (e.g. one station), default is self.trips.
         """
+        if workers and workers > 1:
+            trips = self.trips if trips is None else trips
+            agg = parallel_aggregates(trips, workers=workers, partition_by=partition_by, tiers=self.member_tiers)
+        elif trips is None:
+            agg = self.trip_aggregates
+        else:
+            agg = TripAggregates.from_trips(trips, tiers=self.member_tiers)
+        return self._stats_from_aggregates(agg)
+
+    def apply_trip_batch(self, batch, state_dir=INCREMENTAL_DIR):
+        """
+        Incremental mode: adds a new batch of trips to the aggregate state on disk
+        and returns the stats of all trips applied so far, without reading the history again.
+        'batch' is a cleaned trips frame or a CSV file (e.g. data/trips_2024-06-01.csv)
+        that is cleaned with the trips rules first.
+        Stations and maintenance have to be loaded already (initialize_system).
+        """
+        if not isinstance(batch, pandas.DataFrame):
+            batch = self.load_and_clean_data(batch)
+
+        state = IncrementalStats(state_dir, CLEANING_RULES_VERSION)
+        added = state.apply(batch, self.member_tiers)
+        print(f"Trip batch: {added} new trips, {len(batch) - added} already applied "
+              f"({state.meta['trips']} trips in {state.meta['batches']} batches).")
+        return self._stats_from_aggregates(state.aggregates)
+
+    def incremental_stats(self, state_dir=INCREMENTAL_DIR):
+        """Stats of the current incremental state (without applying a new batch)"""
+        state = IncrementalStats(state_dir, CLEANING_RULES_VERSION)
+        return self._stats_from_aggregates(state.aggregates)
+
+    def _stats_from_aggregates(self, agg):
+        """Builds the stats dictionary from (possibly merged) trip aggregates"""
         stats = {}
 
         # 1. Total trips, distance, avg duration
-        stats['total_trips'] = len(self.trips)
-        stats['total_distance'] = self.trips['distance_km'].sum()
-        stats['avg_distance'] = self.trips['distance_km'].mean()
-        # Assumes 'duration_minutes' exists or calculates it
-        if 'duration_minutes' not in self.trips.columns:
-            self.trips['duration_minutes'] = (self.trips['end_time'] - self.trips['start_time']).dt.total_seconds() / 60
-        stats['avg_duration'] = self.trips['duration_minutes'].mean()
+        stats['total_trips'] = agg.trip_count
+        stats['total_distance'] = agg.distance_sum
+        stats['avg_distance'] = agg.distance_sum / agg.distance_count if agg.distance_count else numpy.nan
+        stats['avg_duration'] = agg.duration_sum / agg.duration_count if agg.duration_count else numpy.nan
 
         # 2. Top 10 Start & End Stations
-        top_start = self.trips['start_station_id'].value_counts().head(10)
-        top_end = self.trips['end_station_id'].value_counts().head(10)
+        top_start = top_counts(agg.station_counts(level=0), 10)
+        top_end = top_counts(agg.station_counts(level=1), 10)
         # Map IDs to names
         stats['top_10_start'] = self._map_station_names(top_start)
         stats['top_10_end'] = self._map_station_names(top_end)
 
         # 3. Peak usage hours
-        stats['peak_hour'] = self.trips['start_time'].dt.hour.mode()[0]
+        stats['peak_hour'] = agg.peak_hour()
 
         # 4. Day of the week with highest volume
-        # day_name() returns Monday, Tuesday...
-        stats['busiest_day'] = self.trips['start_time'].dt.day_name().value_counts().idxmax()
+        stats['busiest_day'] = agg.busiest_day()
 
         # 5. Avg distance by user type
-        stats['avg_dist_by_user'] = self.trips.groupby('user_type')['distance_km'].mean().to_dict()
+        by_type = agg.users.groupby(level='user_type', observed=True).sum()
+        stats['avg_dist_by_user'] = (by_type['distance_sum'] / by_type['distance_count']).to_dict()
 
         # 6. Bike Utilization Rate
         # Formula: (Total Minutes Ridden) / (Total Fleet Minutes Available)
         # Total Fleet Minutes = (Number of unique bikes) * (Time range of dataset in minutes)
-        if not self.trips.empty and 'duration_minutes' in self.trips.columns:
-            total_trip_minutes = self.trips['duration_minutes'].sum()
-            unique_bikes_count = self.trips['bike_id'].nunique()
-            
+        stats['utilization_rate'] = 0.0
+        if agg.trip_count > 0:
+            unique_bikes_count = len(agg.bikes)
+
             # Calculate time range of dataset
-            time_range_min = (self.trips['end_time'].max() - self.trips['start_time'].min()).total_seconds() / 60
-            
+            time_range_min = (agg.max_end - agg.min_start).total_seconds() / 60
+
             # Avoid division by zero
             if time_range_min > 0 and unique_bikes_count > 0:
-                 total_potential_minutes = unique_bikes_count * time_range_min
-                 stats['utilization_rate'] = (total_trip_minutes / total_potential_minutes) * 100
-            else:
-                 stats['utilization_rate'] = 0.0
-        else:
-            stats['utilization_rate'] = 0.0
+                total_potential_minutes = unique_bikes_count * time_range_min
+                stats['utilization_rate'] = (agg.duration_sum / total_potential_minutes) * 100
 
-        # 7. Monthly trip trend
-        # Extract YYYY-MM
-        self.trips['month_year'] = self.trips['start_time'].dt.to_period('M')
-        stats['monthly_trend'] = self.trips['month_year'].value_counts().sort_index().to_dict()
+        # 7. Monthly trip trend (YYYY-MM periods)
+        stats['monthly_trend'] = agg.month_counts()
 
         # 8. Top 15 active users
-        stats['top_users'] = self.trips['user_id'].value_counts().head(15).to_dict()
+        top_users = top_counts(agg.users['trips'].groupby(level='user_id').sum(), 15)
+        top_users.index = format_ids(top_users.index, 'user_id')
+        stats['top_users'] = top_users.to_dict()
 
         # 9. Maintenance cost by bike type (classic vs. electric)
-        # Create a mapping of bike_id -> bike_type from trips data
-        bike_types_map = self.trips.set_index('bike_id')['bike_type'].to_dict()
-        
-        # Map bike_type to maintenance dataframe
-        # Ensure maintenance has bike_id
+        # bike_type of every bike comes from its last trip
         if 'bike_id' in self.maintenance.columns:
-            self.maintenance['bike_type'] = self.maintenance['bike_id'].map(bike_types_map).fillna('Unknown')
-            stats['maint_cost_by_type'] = self.maintenance.groupby('bike_type')['cost'].sum().to_dict()
+            maint_bike_types = self.maintenance['bike_id'].map(agg.bikes).fillna('Unknown')
+            stats['maint_cost_by_type'] = self.maintenance['cost'].groupby(maint_bike_types).sum().to_dict()
         else:
             stats['maint_cost_by_type'] = {"Error": "bike_id missing in maintenance data"}
-        
+
         stats['total_maint_cost'] = self.maintenance['cost'].sum()
 
         # 10. Most common routes (Start -> End)
-        stats['top_routes'] = self.trips.groupby(['start_station_id', 'end_station_id']).size().nlargest(10).reset_index(name='count')
-        
-        # Map IDs to Names for Route using the shared helper
-        stats['top_routes']['start_name'] = stats['top_routes']['start_station_id'].apply(self.get_station_name)
-        stats['top_routes']['end_name'] = stats['top_routes']['end_station_id'].apply(self.get_station_name)
+        stats['top_routes'] = top_counts(agg.routes, 10).reset_index(name='count')
+
+        # Map IDs to Names for Route using the station registry
+        stats['top_routes']['start_name'] = self.station_registry.names_for(stats['top_routes']['start_station_id'])
+        stats['top_routes']['end_name'] = self.station_registry.names_for(stats['top_routes']['end_station_id'])
+        for col in ('start_station_id', 'end_station_id'):
+            stats['top_routes'][col] = format_ids(stats['top_routes'][col], col)
+
+        # 11. Revenue by plan under the standard tariff (vectorised fares, see pricing.py)
+        stats['revenue_by_plan'] = agg.revenue_by_plan()
+        stats['unpriced_trips'] = agg.unpriced_trips()
 
         # 12. Avg trips per user
-        stats['avg_trips_per_user_type'] = self.trips.groupby('user_type')['user_id'].value_counts().groupby('user_type').mean().to_dict()
+        stats['avg_trips_per_user_type'] = (by_type['trips'] / agg.users.groupby(level='user_type', observed=True).size()).to_dict()
 
         return stats
     
+    def validate_trip_distances(self, min_ratio=1.0):
+        """
+        Compares the reported distance_km of every trip with the great-circle distance
+        between its stations (one gather from the station distance matrix).
+        A ride can not be shorter than the straight line, so trips with
+        distance_km < min_ratio * implied distance are flagged.
+        Returns a frame with trip_id, distance_km, implied_km and the 'suspicious' flag.
+        """
+        implied = self.station_registry.implied_distances(
+            self.trips['start_station_id'], self.trips['end_station_id'])
+        reported = self.trips['distance_km'].to_numpy()
+        return pandas.DataFrame({
+            'trip_id': self.trips['trip_id'].to_numpy(),
+            'distance_km': reported,
+            'implied_km': implied,
+            'suspicious': reported < min_ratio * implied,
+        })
+
+    def od_matrix(self, by=()):
+        """
+        Origin-destination matrix of the trips (ODMatrix), optionally sliced by 'hour',
+        'weekday' and/or 'user_type', e.g. od_matrix(by='hour').top_per_station(50, where={'hour': 8})
+        """
+        return ODMatrix.from_trips(self.trips, self.station_registry, by)
+
+    def station_flow(self, initial_fill=0.5):
+        """
+        Occupancy of every station over time (StationFlow), every station starts at
+        'initial_fill' * capacity. Use .breaches() and .hourly_rebalancing() on the result.
+        """
+        return StationFlow.from_trips(self.trips, self.station_registry, initial_fill)
+
+    def top_destinations(self, n=10):
+        """
+        Top 'n' end stations for every start station.
+        Returns a frame with start/end station IDs and names and the trip count,
+        sorted by start station and count.
+        """
+        routes = self.trips.groupby(['start_station_id', 'end_station_id'], observed=True).size()
+        routes = routes.reset_index(name='count').sort_values(
+            ['start_station_id', 'count', 'end_station_id'], ascending=[True, False, True], kind='stable')
+        top = routes.groupby('start_station_id', sort=False).head(n).reset_index(drop=True)
+
+        top['start_name'] = self.station_registry.names_for(top['start_station_id'])
+        top['end_name'] = self.station_registry.names_for(top['end_station_id'])
+        return top
+
     def get_station_name(self, station_id):
         """Helper to get a single station name from an ID"""
-        name = self.stations.loc[self.stations['station_id'] == station_id, 'station_name']
-        return name.values[0] if not name.empty else f"Station {station_id}"
+        return self.station_registry.name(station_id)
 
     def _map_station_names(self, series_ids):
         """Helper to map station IDs (index) to names (keys) with counts (values)"""
-        result = {}
-        for sid, count in series_ids.items():
-            station_label = self.get_station_name(sid)
-            result[station_label] = count
-        return result
-    
\ No newline at end of file
+        return self.station_registry.label_counts(series_ids)
@@ -0,0 +1,135 @@
+"""
+Benchmark suite: times and memory-profiles the pipeline stages on synthetic datasets of
+growing size and writes the results as JSON, so runs of two releases can be diffed.
+
+Usage: python benchmark.py [--sizes 10000 100000 1000000] [--output benchmark.json]
+                           [--compare old_benchmark.json] [--keep-data DIR]
+"""
+
+import argparse
+import json
+import platform
+import tempfile
+from pathlib import Path
+
+from utils import StepProfiler
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# the recursive merge sort is pure Python, larger inputs are sampled down to this many values
+MERGE_SORT_LIMIT = 200_000
+
+
+def dataset_shape(n_trips):
+    """Station, user, bike and maintenance counts that grow with the number of trips"""
+    return {
+        "n_stations": max(15, n_trips // 2_000),
+        "n_users": max(80, n_trips // 20),
+        "n_bikes": max(60, n_trips // 200),
+        "n_maintenance": max(200, n_trips // 50),
+    }
+
+
+def run_size(n_trips, data_dir, seed=42):
+    """Generates one dataset and measures every stage; returns a list of result rows"""
+    from data.generate_datasets import write_datasets
+
+    shape = dataset_shape(n_trips)
+    write_datasets(data_dir, n_trips=n_trips, seed=seed, **shape)
+
+    # wall times come from a run without tracemalloc (it slows pandas down a lot),
+    # peak memory from a second run with it
+    timed = StepProfiler(enabled=True, trace_memory=False)
+    rows = run_stages(timed, data_dir, seed)
+    with StepProfiler(enabled=True) as traced:
+        run_stages(traced, data_dir, seed)
+
+    return [{"trips": n_trips, "stage": name, "seconds": round(elapsed, 6), "peak_mb": round(peak_mb, 3),
+             "rows": rows, **shape}
+            for (name, elapsed, _, _), (_, _, peak_mb, _) in zip(timed.steps, traced.steps)]
+
+
+def run_stages(profiler, data_dir, seed):
+    """Runs every measured stage once; returns the number of cleaned trips"""
+    from analyzer import BikeShare
+    from algorithms import Algorithms
+    from visualization import Visualizer
+
+    system = BikeShare()
+    with profiler.step("load_and_clean_data"):
+        system.stations = system.load_and_clean_data(str(data_dir / "stations.csv"))
+        system.trips = system.load_and_clean_data(str(data_dir / "trips.csv"))
+        system.maintenance = system.load_and_clean_data(str(data_dir / "maintenance.csv"))
+
+    with profiler.step("generate_business_stats"):
+        system.generate_business_stats()
+
+    distances = system.trips['distance_km'].dropna()
+    if len(distances) > MERGE_SORT_LIMIT:
+        distances = distances.sample(MERGE_SORT_LIMIT, random_state=seed)
+    distances = distances.tolist()
+    with profiler.step("merge_sort"):
+        Algorithms.merge_sort(distances)
+
+    with profiler.step("visualizations"):
+        viz = Visualizer(output_path=data_dir / "figures")
+        viz.render_all(system.trips, system.stations, system.station_registry, force=True,
+                       aggregates=system.trip_aggregates)
+    return len(system.trips)
+
+
+def environment():
+    import numpy
+    import pandas
+    return {"python": platform.python_version(), "numpy": numpy.__version__,
+            "pandas": pandas.__version__, "platform": platform.platform()}
+
+
+def compare(results, old_results):
+    """Text table of the time / memory ratio new / old for every (size, stage)"""
+    old = {(row["trips"], row["stage"]): row for row in old_results["results"]}
+    lines = [f"{'trips':>10}  {'stage':<24}{'time':>10}{'memory':>10}"]
+    for row in results["results"]:
+        before = old.get((row["trips"], row["stage"]))
+        if before is None:
+            continue
+        time_ratio = row["seconds"] / before["seconds"] if before["seconds"] else float("nan")
+        mem_ratio = row["peak_mb"] / before["peak_mb"] if before["peak_mb"] else float("nan")
+        lines.append(f"{row['trips']:>10}  {row['stage']:<24}{time_ratio:>9.2f}x{mem_ratio:>9.2f}x")
+    return "\n".join(lines)
+
+
+def main(sizes=DEFAULT_SIZES, output="benchmark.json", compare_with=None, keep_data=None):
+    results = {"environment": environment(), "results": []}
+    for n_trips in sizes:
+        print(f"Benchmark: {n_trips} trips...")
+        if keep_data:
+            data_dir = Path(keep_data) / f"trips_{n_trips}"
+            results["results"] += run_size(n_trips, data_dir)
+        else:
+            with tempfile.TemporaryDirectory(prefix="citybike_bench_") as tmp_dir:
+                results["results"] += run_size(n_trips, Path(tmp_dir))
+
+    Path(output).write_text(json.dumps(results, indent=2))
+    for row in results["results"]:
+        print(f"{row['trips']:>10}  {row['stage']:<24}{row['seconds']:>10.3f}s{row['peak_mb']:>10.1f} MB")
+    print(f"Results written to {output}")
+
+    if compare_with:
+        print(f"\nCompared with {compare_with} (new / old):")
+        print(compare(results, json.loads(Path(compare_with).read_text())))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CityBike pipeline benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="number of generated trips per run")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--keep-data", help="keep the generated datasets in this directory")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.sizes, args.output, args.compare, args.keep_data)
@@ -0,0 +1,121 @@
+"""
+Columnar (Feather / Arrow IPC) cache for the cleaned datasets.
+A warm start reads the memory-mapped cache instead of parsing and cleaning the CSV again.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from schema import restore_ids
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional, without it the cache is simply disabled
+    feather = None
+
+# size of the blocks used when hashing the source files
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class DataCache:
+    """
+    Stores every cleaned table as an uncompressed Feather file next to a small JSON
+    file with the fingerprint of its source (size, mtime, content hash) and the
+    version of the cleaning rules. A cache entry is only used when all of them match.
+    """
+
+    def __init__(self, cache_dir, rules_version):
+        self.cache_dir = Path(cache_dir)
+        self.rules_version = rules_version
+
+    @property
+    def enabled(self):
+        return feather is not None
+
+    @staticmethod
+    def fingerprint(source_path):
+        """Size, mtime and blake2b content hash of a source file"""
+        source_path = Path(source_path)
+        stat = source_path.stat()
+        digest = hashlib.blake2b(digest_size=16)
+        with open(source_path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "content_hash": digest.hexdigest(),
+        }
+
+    def load(self, name, source_path):
+        """Returns the cached table for 'name' or None if it is missing or outdated"""
+        if not self.enabled:
+            return None
+
+        data_path, meta_path = self._paths(name)
+        if not data_path.exists() or not meta_path.exists():
+            return None
+
+        meta = json.loads(meta_path.read_text())
+        if meta.get("rules_version") != self.rules_version:
+            return None
+
+        # cheap check first, the content hash needs to read the whole file
+        source = meta.get("source", {})
+        if source.get("size") != Path(source_path).stat().st_size:
+            return None
+        if source != self.fingerprint(source_path):
+            return None
+
+        table = feather.read_table(data_path, memory_map=True)
+        return table.to_pandas()
+
+    def save(self, name, source_path, df):
+        """Writes the cleaned table and the fingerprint of its source file"""
+        if not self.enabled:
+            return None
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        data_path, meta_path = self._paths(name)
+
+        # uncompressed, so that the file can be memory-mapped on the next start
+        tmp_path = data_path.with_suffix(".tmp")
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed")
+        os.replace(tmp_path, data_path)
+
+        meta = {
+            "rules_version": self.rules_version,
+            "source": self.fingerprint(source_path),
+            "rows": len(df),
+        }
+        meta_path.write_text(json.dumps(meta, indent=2))
+        return data_path
+
+    def _paths(self, name):
+        stem = Path(name).stem
+        return self.cache_dir / f"{stem}.feather", self.cache_dir / f"{stem}.meta.json"
+
+
+def save_table(df, path, formats=("csv",)):
+    """
+    Saves a table as CSV and/or Feather.
+    'path' is used without its suffix, e.g. output/trips_clean -> trips_clean.csv, trips_clean.feather
+    CSV files get the original text IDs (TR10000), Feather keeps the compact int32 IDs.
+    """
+    path = Path(path)
+    written = []
+    for fmt in formats:
+        if fmt == "csv":
+            target = path.with_suffix(".csv")
+            restore_ids(df).to_csv(target, index=False)
+        elif fmt == "feather":
+            if feather is None:
+                raise ImportError("pyarrow is required to save tables in the Feather format")
+            target = path.with_suffix(".feather")
+            feather.write_feather(df.reset_index(drop=True), target)
+        else:
+            raise ValueError(f"Unknown table format: {fmt}")
+        written.append(target)
+    return written
@@ -0,0 +1,189 @@
+"""
+Declarative cleaning rules for every source file.
+A rule set is plain configuration (see CLEANING_RULES), so another city with other rules only
+needs another entry. All row filters are evaluated on the same frame and combined into one
+boolean mask that is applied once; fills only touch the columns that have missing values.
+"""
+
+import operator
+from pathlib import Path
+
+import pandas
+
+from metrics import METRICS
+from schema import apply_schema
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# rules shared by the known datasets: missing numbers become 0, missing text 'Unknown'
+# (columns typed by the schema keep their own missing values)
+REMAINING_FILLS = {'fill_numeric': 0, 'fill_text': 'Unknown'}
+
+CLEANING_RULES = {
+    'stations.csv': {
+        **REMAINING_FILLS,
+    },
+    'trips.csv': {
+        'filters': [
+            # a negative (or missing) distance is a broken record
+            {'name': 'negative_distance', 'column': 'distance_km', 'op': '>=', 'value': 0},
+            # keep only records where trip duration was > 0 sec
+            {'name': 'non_positive_duration', 'column': 'end_time', 'op': '>', 'other': 'start_time'},
+        ],
+        **REMAINING_FILLS,
+    },
+    'maintenance.csv': {
+        'fills': {'cost': 0},
+        **REMAINING_FILLS,
+    },
+}
+
+# files without an entry: the columns are recognised by their names
+DEFAULT_RULES = {
+    'parse_dates': 'auto',
+    'filters': CLEANING_RULES['trips.csv']['filters'],
+    # for ebikes set empty values with average values
+    'fills': {'cost': 0, 'battery_level': 'mean'},
+    **REMAINING_FILLS,
+}
+
+
+class RuleSet:
+    """
+    Cleaning rules of one dataset, built from a dict with the optional keys
+      parse_dates:  columns converted with to_datetime(errors='coerce') when the file has no
+                    schema; 'auto' = every column with 'date' or 'time' in its name
+      filters:      [{'name', 'column', 'op', 'value' | 'other'}]; a row is kept if it passes
+                    all filters (a missing value fails). Filters on missing columns are skipped.
+      fills:        {column: value or 'mean'} for missing values
+      fill_numeric: value for missing numbers in all other (untyped) numeric columns
+      fill_text:    value for missing text in all other (untyped) text columns
+    """
+
+    def __init__(self, spec):
+        self.parse_dates = spec.get('parse_dates', ())
+        self.filters = list(spec.get('filters', ()))
+        self.fills = dict(spec.get('fills', {}))
+        self.fill_numeric = spec.get('fill_numeric')
+        self.fill_text = spec.get('fill_text')
+        for rule in self.filters:
+            if rule['op'] not in OPERATORS:
+                raise ValueError(f"Unknown operator in rule '{rule['name']}': {rule['op']}")
+
+    @property
+    def mean_fills(self):
+        """Columns filled with their average (the chunked mode computes it over the whole file first)"""
+        return [col for col, value in self.fills.items() if value == 'mean']
+
+    def date_columns(self, df, schema=None):
+        if schema:
+            return [col for col in schema['datetimes'] if col in df.columns]
+        if self.parse_dates == 'auto':
+            return [col for col in df.columns if 'date' in col or 'time' in col]
+        return [col for col in self.parse_dates if col in df.columns]
+
+    def filter_mask(self, df):
+        """Combined keep-mask of all filters and the number of rows every filter rejects"""
+        keep = pandas.Series(True, index=df.index)
+        rejected = {}
+        for rule in self.filters:
+            needed = [rule['column']] + ([rule['other']] if 'other' in rule else [])
+            if not all(col in df.columns for col in needed):
+                continue
+            right = df[rule['other']] if 'other' in rule else rule['value']
+            passed = OPERATORS[rule['op']](df[rule['column']], right).fillna(False).astype(bool)
+            rejected[rule['name']] = int((~passed).sum())
+            keep &= passed
+        return keep.to_numpy(), rejected
+
+    @staticmethod
+    def _record(source, report, name, rows, count):
+        """Rows a rule removed or coerced, for METRICS and the cleaning report"""
+        METRICS.rule(source, name, rows, rows - count)
+        if report is not None:
+            report[name] = report.get(name, 0) + count
+
+    def apply(self, df, schema=None, fill_values=None, numeric_cols=None, text_cols=None,
+              source=None, report=None):
+        """
+        Cleans an already de-duplicated frame and returns it.
+        'fill_values' ({column: value}) and 'numeric_cols' / 'text_cols' are given by the chunked
+        mode, where averages and column types have to be the same for every chunk.
+        Rejected rows per rule and rows with coerced IDs / categories are added to 'report'
+        ({rule name: rows}) and recorded in METRICS.
+        """
+        fill_values = fill_values or {}
+        date_columns = self.date_columns(df, schema)
+        if METRICS.enabled and date_columns:
+            dates_before = df[date_columns].notna().to_numpy(dtype=bool)
+
+        # 1. Types: IDs, categories and datetimes from the schema (missing values there become
+        # UNKNOWN_ID / 'Unknown' / NaT), otherwise the date columns are parsed
+        if schema:
+            coerced = {}
+            apply_schema(df, schema, coerced)
+            for name, count in coerced.items():
+                self._record(source, report, name, len(df), count)
+            typed_columns = schema['ids'] + list(schema['categories']) + list(schema['datetimes'])
+        else:
+            typed_columns = date_columns
+            for col in date_columns:
+                df[col] = pandas.to_datetime(df[col], errors='coerce')
+
+        if METRICS.enabled and date_columns:
+            # rows where a date that was present could not be parsed (became NaT)
+            coerced = (dates_before & ~df[date_columns].notna().to_numpy(dtype=bool)).any(axis=1)
+            METRICS.rule(source, "coerced_dates", len(df), len(df) - int(coerced.sum()))
+
+        # averages are taken over all rows, before any row is dropped
+        fills = {}
+        for col, value in self.fills.items():
+            if col in df.columns:
+                fills[col] = fill_values.get(col, df[col].mean()) if value == 'mean' else value
+
+        # 2. All row filters as one mask, the frame is copied at most once
+        keep, rejected = self.filter_mask(df)
+        for name, count in rejected.items():
+            self._record(source, report, name, len(df), count)
+        if not keep.all():
+            df = df[keep]
+
+        # 3. Fills, only for columns that really have missing values
+        if numeric_cols is None:
+            numeric_cols = df.select_dtypes(include=['number']).columns
+        if text_cols is None:
+            text_cols = df.select_dtypes(include=['object']).columns
+        if self.fill_numeric is not None:
+            for col in numeric_cols:
+                if col not in typed_columns and col not in fills:
+                    fills[col] = self.fill_numeric
+        if self.fill_text is not None:
+            for col in text_cols:
+                if col not in typed_columns and col not in fills:
+                    fills[col] = self.fill_text
+        for col, value in fills.items():
+            if col in df.columns and df[col].hasnans:
+                df[col] = df[col].fillna(value)
+
+        return df
+
+
+def get_rules(file_name):
+    """
+    RuleSet of a source file (DEFAULT_RULES for files without an entry).
+    Batch files like trips_2024-06-01.csv use the rules of trips.csv.
+    """
+    name = Path(file_name).name if file_name else ''
+    if name in CLEANING_RULES:
+        return RuleSet(CLEANING_RULES[name])
+    for rules_name, spec in CLEANING_RULES.items():
+        if name.startswith(Path(rules_name).stem + '_'):
+            return RuleSet(spec)
+    return RuleSet(DEFAULT_RULES)
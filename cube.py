@@ -0,0 +1,394 @@
+"""
+Pre-aggregated rollup cube of the trips.
+Trip counts, arrivals and distance / duration sums are kept in dense NumPy arrays with the
+dimensions date x station x hour x user_type x bike_type. Peak hour, busiest day, monthly
+trend and top stations for any filter combination are array reductions over the cube, so
+their cost depends on the cube size and not on the number of trips.
+The cube can live in memory or in memory-mapped files on disk; the date axis comes first,
+so new days are appended at the end of the files.
+"""
+
+import calendar
+import json
+import os
+from pathlib import Path
+
+import numpy
+import pandas
+
+from aggregation import top_counts
+
+DIMENSIONS = ("date", "station", "hour", "user_type", "bike_type")
+# counts / distance / duration are per start station, arrivals per end station
+MEASURES = {
+    "counts": numpy.int32,
+    "arrivals": numpy.int32,
+    "distance": numpy.float32,
+    "duration": numpy.float32,
+}
+# layout entry with the labels of an axis
+LAYOUT_KEYS = {"station": "stations", "user_type": "user_types", "bike_type": "bike_types"}
+# filters accepted by the queries, see RollupCube.select
+FILTERS = ("start", "end", "station", "hour", "weekday", "user_type", "bike_type")
+
+
+def _as_list(value):
+    return [value] if isinstance(value, (int, str, numpy.integer)) else list(value)
+
+
+def _trip_columns(trips):
+    """Day number, hour and validity of every trip start (NaT starts are not counted)"""
+    values = trips['start_time'].to_numpy(dtype='datetime64[ns]')
+    valid = ~numpy.isnat(values)
+    days = values.astype('datetime64[D]')
+    hours = (values - days).astype('timedelta64[h]').astype(numpy.int64)
+    return days.astype(numpy.int64), hours, valid
+
+
+def _observed_labels(column):
+    """Sorted labels of the values that occur in a column (unused categories are left out)"""
+    return sorted(str(value) for value in pandas.unique(column.dropna().astype(object)))
+
+
+def _sum_axes(array, keep, keepdims=False):
+    """
+    Sums 'array' over every axis whose 'keep' flag is False (int64 / float64 accumulator).
+    Neighbouring axes with the same flag are merged first, so the sums run over long
+    contiguous rows instead of a strided multi-axis reduction.
+    """
+    dtype = numpy.int64 if numpy.issubdtype(array.dtype, numpy.integer) else numpy.float64
+    shape, flags = [], []
+    for size, flag in zip(array.shape, keep):
+        if flags and flags[-1] == flag:
+            shape[-1] *= size
+        else:
+            shape.append(size)
+            flags.append(flag)
+    summed = tuple(axis for axis, flag in enumerate(flags) if not flag)
+    result = numpy.ascontiguousarray(array).reshape(shape).sum(axis=summed, dtype=dtype)
+    if keepdims:
+        return result.reshape([size if flag else 1 for size, flag in zip(array.shape, keep)])
+    return result.reshape([size for size, flag in zip(array.shape, keep) if flag])
+
+
+class RollupCube:
+    """
+    Dense rollup of the trips. 'layout' describes the axes:
+      first_day   day number (days since 1970-01-01) of the first date row
+      days        number of date rows
+      stations    sorted station IDs (start and end stations)
+      user_types / bike_types   labels along the last two axes
+    'arrays' holds one array per measure of shape (days, stations, 24, user_types, bike_types).
+    With a 'path' the arrays are numpy.memmap files in that directory (plus meta.json).
+    """
+
+    def __init__(self, layout, arrays, path=None, trips=0, generation=None, complete=True):
+        self.layout = layout
+        self.arrays = arrays
+        self.path = Path(path) if path is not None else None
+        self.trips = trips
+        # caller-defined version of the data in the cube (e.g. the incremental state generation);
+        # complete=False means an update was interrupted and the arrays are not consistent
+        self.generation = generation
+        self.complete = complete
+        # per-measure sums over all stations, rebuilt after every update
+        self._totals = {}
+
+    # --- building and persistence ---
+
+    @classmethod
+    def build(cls, trips, path=None, generation=None):
+        """Cube of a trips frame, stored in 'path' (memory-mapped) or kept in memory"""
+        layout = {"first_day": 0, "days": 0, "stations": [], "user_types": [], "bike_types": []}
+        cube = cls(layout, cls._allocate(layout, path), path)
+        cube.update(trips, generation)
+        return cube
+
+    @classmethod
+    def open(cls, path, mode='r+'):
+        """Opens a cube saved in 'path'; mode='r' maps the files read-only"""
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text())
+        layout = meta["layout"]
+        shape = cls._shape(layout)
+        state = (meta["trips"], meta.get("generation"), meta.get("complete", True))
+        if not all(shape):
+            return cls(layout, cls._allocate(layout), path, *state)
+        arrays = {name: numpy.memmap(path / f"{name}.bin", dtype=dtype, mode=mode, shape=shape)
+                  for name, dtype in MEASURES.items()}
+        return cls(layout, arrays, path, *state)
+
+    @staticmethod
+    def _shape(layout):
+        return (layout["days"], len(layout["stations"]), 24, len(layout["user_types"]), len(layout["bike_types"]))
+
+    @classmethod
+    def _allocate(cls, layout, path=None, suffix=""):
+        """Zeroed arrays of a layout, as new files in 'path' or in memory"""
+        shape = cls._shape(layout)
+        if path is None:
+            return {name: numpy.zeros(shape, dtype=dtype) for name, dtype in MEASURES.items()}
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        arrays = {}
+        for name, dtype in MEASURES.items():
+            file_path = path / f"{name}.bin{suffix}"
+            with open(file_path, "wb") as f:
+                f.truncate(int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize)
+            # a memmap of size 0 is not possible, empty cubes use a plain array
+            arrays[name] = (numpy.memmap(file_path, dtype=dtype, mode='r+', shape=shape) if all(shape)
+                            else numpy.zeros(shape, dtype=dtype))
+        return arrays
+
+    def save(self):
+        """Flushes the memory-mapped arrays and writes meta.json (no-op for in-memory cubes)"""
+        if self.path is None:
+            return
+        for array in self.arrays.values():
+            if isinstance(array, numpy.memmap):
+                array.flush()
+        self.complete = True
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {"layout": self.layout, "trips": self.trips, "generation": self.generation,
+                "complete": self.complete}
+        tmp_path = self.path / "meta.tmp"
+        tmp_path.write_text(json.dumps(meta, indent=2))
+        os.replace(tmp_path, self.path / "meta.json")
+
+    def _resize(self, layout):
+        """Changes the layout; days added at the end extend the arrays, anything else re-lays them out"""
+        old = self.layout
+        if layout == old:
+            return
+        same_axes = all(layout[key] == old[key] for key in ("first_day", "stations", "user_types", "bike_types"))
+        if same_axes and old["days"]:
+            self._append_days(layout)
+            return
+
+        arrays = self._allocate(layout, self.path, suffix=".tmp")
+        if old["days"]:
+            positions = numpy.ix_(
+                numpy.arange(old["days"]) + old["first_day"] - layout["first_day"],
+                pandas.Index(layout["stations"]).get_indexer(old["stations"]),
+                numpy.arange(24),
+                pandas.Index(layout["user_types"]).get_indexer(old["user_types"]),
+                pandas.Index(layout["bike_types"]).get_indexer(old["bike_types"]),
+            )
+            for name, array in arrays.items():
+                array[positions] = self.arrays[name]
+        if self.path is not None:
+            for name, array in arrays.items():
+                if isinstance(array, numpy.memmap):
+                    array.flush()
+                os.replace(self.path / f"{name}.bin.tmp", self.path / f"{name}.bin")
+        self.arrays = arrays
+        self.layout = layout
+
+    def _append_days(self, layout):
+        shape = self._shape(layout)
+        for name, dtype in MEASURES.items():
+            if self.path is None:
+                extra = numpy.zeros((layout["days"] - self.layout["days"],) + shape[1:], dtype=dtype)
+                self.arrays[name] = numpy.concatenate([self.arrays[name], extra])
+                continue
+            file_path = self.path / f"{name}.bin"
+            self.arrays[name].flush()
+            self.arrays[name] = None
+            with open(file_path, "r+b") as f:
+                f.truncate(int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize)
+            self.arrays[name] = numpy.memmap(file_path, dtype=dtype, mode='r+', shape=shape)
+        self.layout = layout
+
+    def update(self, trips, generation=None):
+        """
+        Adds a batch of trips (e.g. the trips of a new day) to the cube and saves it with the
+        new 'generation'. The caller passes every trip once; trips with a missing start time
+        are not counted. A cube on disk is marked incomplete until the update is flushed.
+        """
+        self.generation = generation
+        if self.path is not None and self.path.exists():
+            self.complete = False
+            self._write_meta()
+        if trips.empty:
+            self.save()
+            return 0
+        days, hours, valid = _trip_columns(trips)
+        user_types = trips['user_type'].astype(object).to_numpy()
+        bike_types = trips['bike_type'].astype(object).to_numpy()
+        valid &= pandas.notna(user_types) & pandas.notna(bike_types)
+        if not valid.any():
+            self.save()
+            return 0
+
+        # grow the axes for new days, stations and labels
+        old = self.layout
+        first_day = int(days[valid].min())
+        last_day = int(days[valid].max())
+        if old["days"]:
+            first_day = min(first_day, old["first_day"])
+            last_day = max(last_day, old["first_day"] + old["days"] - 1)
+        station_ids = numpy.concatenate([trips['start_station_id'].to_numpy()[valid],
+                                         trips['end_station_id'].to_numpy()[valid]])
+        layout = {
+            "first_day": first_day,
+            "days": last_day - first_day + 1,
+            "stations": sorted(set(old["stations"]) | set(int(s) for s in numpy.unique(station_ids))),
+            "user_types": old["user_types"] + [t for t in _observed_labels(trips['user_type'][valid]) if t not in old["user_types"]],
+            "bike_types": old["bike_types"] + [t for t in _observed_labels(trips['bike_type'][valid]) if t not in old["bike_types"]],
+        }
+        self._resize(layout)
+        self._totals = {}
+
+        # flat cell of every trip, relative to the first date row the batch touches
+        stations = pandas.Index(layout["stations"])
+        n_users, n_bikes = len(layout["user_types"]), len(layout["bike_types"])
+        day_cells = len(stations) * 24 * n_users * n_bikes
+        day_offsets = days[valid] - layout["first_day"]
+        low, high = int(day_offsets.min()), int(day_offsets.max()) + 1
+        slot = ((day_offsets - low) * len(stations) * 24 * n_users
+                + hours[valid] * n_users
+                + pandas.Index(layout["user_types"]).get_indexer(user_types[valid].astype(str))) * n_bikes \
+            + pandas.Index(layout["bike_types"]).get_indexer(bike_types[valid].astype(str))
+        station_step = 24 * n_users * n_bikes
+        start_keys = slot + stations.get_indexer(trips['start_station_id'].to_numpy()[valid]) * station_step
+        end_keys = slot + stations.get_indexer(trips['end_station_id'].to_numpy()[valid]) * station_step
+
+        if 'duration_minutes' in trips.columns:
+            duration = trips['duration_minutes'].to_numpy(dtype=numpy.float64)
+        else:
+            duration = ((trips['end_time'] - trips['start_time']).dt.total_seconds() / 60).to_numpy(dtype=numpy.float64)
+        distance = trips['distance_km'].to_numpy(dtype=numpy.float64)
+        size = (high - low) * day_cells
+        additions = {
+            "counts": numpy.bincount(start_keys, minlength=size),
+            "arrivals": numpy.bincount(end_keys, minlength=size),
+            "distance": numpy.bincount(start_keys, weights=numpy.nan_to_num(distance[valid]), minlength=size),
+            "duration": numpy.bincount(start_keys, weights=numpy.nan_to_num(duration[valid]), minlength=size),
+        }
+        for name, values in additions.items():
+            flat = self.arrays[name].reshape(-1)
+            flat[low * day_cells:high * day_cells] += values.astype(MEASURES[name])
+
+        added = int(valid.sum())
+        self.trips += added
+        self.save()
+        return added
+
+    # --- queries ---
+
+    @property
+    def dates(self):
+        return pandas.to_datetime(numpy.arange(self.layout["days"]) + self.layout["first_day"], unit='D')
+
+    def select(self, measure='counts', keep=(), **where):
+        """
+        Sums one measure over all axes except 'keep', after filtering with
+          start / end       whole days, start inclusive, end exclusive
+          station           station IDs (start stations; end stations for 'arrivals')
+          hour, weekday     0-23, 0 = Monday
+          user_type, bike_type  labels
+        e.g. select('counts', keep=('hour',), user_type='member', start='2024-03-01', end='2024-04-01')
+        """
+        unknown = set(where) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown cube filter: {sorted(unknown)} (filters: {FILTERS})")
+        if where.get("station") is None and "station" not in keep:
+            # most questions are about the whole system, they use the (much smaller) station totals
+            array = self._station_totals(measure)
+        else:
+            array = self.arrays[measure]
+
+        # date range first: a slice is a view, also of the memory-mapped file
+        day_numbers = numpy.arange(self.layout["days"]) + self.layout["first_day"]
+        low = 0 if where.get("start") is None else int(numpy.searchsorted(day_numbers, self._day(where["start"])))
+        high = len(day_numbers) if where.get("end") is None else int(numpy.searchsorted(day_numbers, self._day(where["end"])))
+        array = array[low:max(low, high)]
+        day_numbers = day_numbers[low:max(low, high)]
+        if where.get("weekday") is not None:
+            positions = numpy.flatnonzero(numpy.isin((day_numbers + 3) % 7, _as_list(where["weekday"])))
+            array = array.take(positions, axis=0)
+            day_numbers = day_numbers[positions]
+
+        for axis, dim in enumerate(DIMENSIONS[1:], start=1):
+            if where.get(dim) is not None:
+                array = array.take(self._positions(dim, where[dim]), axis=axis)
+
+        return _sum_axes(array, [dim in keep for dim in DIMENSIONS]), day_numbers
+
+    def _station_totals(self, measure):
+        """The measure summed over all stations, shape (days, 1, 24, user_types, bike_types)"""
+        totals = self._totals.get(measure)
+        if totals is None:
+            totals = _sum_axes(self.arrays[measure], [True, False, True, True, True], keepdims=True)
+            self._totals[measure] = totals
+        return totals
+
+    def _labels(self, dim):
+        if dim == "hour":
+            return pandas.RangeIndex(24)
+        return pandas.Index(self.layout[LAYOUT_KEYS[dim]])
+
+    def _positions(self, dim, values):
+        """Positions of the wanted values along an axis, values that do not occur are dropped"""
+        positions = self._labels(dim).get_indexer(_as_list(values))
+        return positions[positions >= 0]
+
+    @staticmethod
+    def _day(value):
+        return pandas.Timestamp(value).to_datetime64().astype('datetime64[D]').astype(numpy.int64)
+
+    def by(self, dim, measure='counts', **where):
+        """
+        One measure per value of a dimension as a Series: date, station, hour, user_type,
+        bike_type or the derived weekday (0 = Monday) and month (Periods)
+        """
+        if dim in ("weekday", "month"):
+            values, day_numbers = self.select(measure, keep=("date",), **where)
+            if dim == "weekday":
+                groups = (day_numbers + 3) % 7
+                return pandas.Series(numpy.bincount(groups, weights=values, minlength=7).astype(values.dtype),
+                                     index=pandas.RangeIndex(7, name="weekday"))
+            months = day_numbers.astype('datetime64[D]').astype('datetime64[M]').astype(numpy.int64)
+            first = int(months.min()) if len(months) else 0
+            sums = numpy.bincount(months - first, weights=values).astype(values.dtype) if len(months) else values
+            index = pandas.PeriodIndex([pandas.Period(year=1970 + m // 12, month=m % 12 + 1, freq='M')
+                                        for m in range(first, first + len(sums))], name="month")
+            return pandas.Series(sums, index=index)
+
+        if dim not in DIMENSIONS:
+            raise ValueError(f"Unknown cube dimension: {dim}")
+        values, day_numbers = self.select(measure, keep=(dim,), **where)
+        if dim == "date":
+            index = pandas.to_datetime(day_numbers, unit='D')
+        else:
+            index = self._labels(dim)
+            if where.get(dim) is not None:
+                index = index[self._positions(dim, where[dim])]
+        return pandas.Series(values, index=index.rename(dim))
+
+    def total(self, measure='counts', **where):
+        return self.select(measure, **where)[0].item()
+
+    def peak_hour(self, **where):
+        """Hour with the most trip starts (the smallest one on ties), None without trips"""
+        hours = self.by("hour", **where).sort_index()
+        return int(hours.idxmax()) if hours.any() else None
+
+    def busiest_day(self, **where):
+        days = self.by("weekday", **where)
+        return calendar.day_name[int(days.idxmax())] if days.any() else None
+
+    def monthly_trend(self, **where):
+        """{Period('YYYY-MM'): trips} of the months with trips"""
+        months = self.by("month", **where)
+        return {period: int(count) for period, count in months.items() if count}
+
+    def top_stations(self, n=10, measure='counts', **where):
+        """Top 'n' stations (Series indexed by station ID), ties ordered by ID; measure='arrivals' for end stations"""
+        counts = self.by("station", measure, **where)
+        return top_counts(counts[counts > 0], n)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
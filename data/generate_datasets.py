@@ -1,11 +1,19 @@
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+"""
+Generates the synthetic source files stations.csv, trips.csv and maintenance.csv.
+Every column is drawn for a whole chunk at once with NumPy, trips are written chunk by chunk,
+so the row count is only limited by disk space (e.g. --trips 100000000).
+
+Usage: python generate_datasets.py [--trips N] [--stations N] [--users N] [--bikes N]
+                                   [--maintenance N] [--chunk-size N] [--seed N] [--output-dir DIR]
+"""
+
+import argparse
+from pathlib import Path
 
-np.random.seed(42)
+import numpy as np
+import pandas as pd
 
-# --- Station data ---
-station_names = [
+STATION_NAMES = [
     "Central Station", "University Campus", "City Hall",
     "Riverside Park", "Market Square", "Tech Hub",
     "Old Town", "Harbor View", "Sports Arena",
@@ -13,117 +21,136 @@ station_names = [
     "Business District", "Lakeside", "Airport Terminal"
 ]
 
-stations = []
-for i, name in enumerate(station_names):
-    stations.append({
-        "station_id": f"ST{100 + i}",
-        "station_name": name,
-        "capacity": np.random.choice([10, 15, 20, 25, 30]),
-        "latitude": round(48.75 + np.random.uniform(0, 0.15), 6),
-        "longitude": round(9.15 + np.random.uniform(0, 0.15), 6),
+MAINT_TYPES = [
+    "tire_repair", "brake_adjustment",
+    "battery_replacement", "chain_lubrication",
+    "general_inspection"
+]
+
+START_DATE = np.datetime64("2024-01-01")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def ids(prefix, numbers):
+    """Text IDs like 'ST100' for an array of numbers"""
+    return prefix + pd.Series(numbers).astype(str)
+
+
+def generate_stations(n_stations, rng):
+    numbers = np.arange(n_stations)
+    # the first 15 stations keep their names, later ones get a running number
+    names = [STATION_NAMES[i % len(STATION_NAMES)] + ("" if i < len(STATION_NAMES) else f" {i // len(STATION_NAMES) + 1}")
+             for i in range(n_stations)]
+    return pd.DataFrame({
+        "station_id": ids("ST", 100 + numbers),
+        "station_name": names,
+        "capacity": rng.choice([10, 15, 20, 25, 30], n_stations),
+        "latitude": np.round(48.75 + rng.uniform(0, 0.15, n_stations), 6),
+        "longitude": np.round(9.15 + rng.uniform(0, 0.15, n_stations), 6),
     })
 
-stations_df = pd.DataFrame(stations)
-stations_df.to_csv("stations.csv", index=False)
-
-# --- Trip data ---
-n_trips = 1500
-user_ids = [f"USR{np.random.randint(1000, 1200)}"
-            for _ in range(80)]
-bike_ids = [f"BK{np.random.randint(200, 350)}"
-            for _ in range(60)]
-start_date = datetime(2024, 1, 1)
-
-trips = []
-for i in range(n_trips):
-    user_type = np.random.choice(
-        ["casual", "member"], p=[0.35, 0.65]
-    )
-    bike_type = np.random.choice(
-        ["classic", "electric"], p=[0.6, 0.4]
-    )
-    start_st = np.random.choice(stations_df["station_id"])
-    end_st = np.random.choice(stations_df["station_id"])
-    start_time = start_date + timedelta(
-        days=np.random.randint(0, 365),
-        hours=np.random.randint(6, 23),
-        minutes=np.random.randint(0, 60),
-    )
-    duration = max(2, np.random.exponential(25))
-    end_time = start_time + timedelta(minutes=duration)
-    distance = round(np.random.uniform(0.5, 15.0), 2)
-    status = np.random.choice(
-        ["completed", "cancelled", np.nan],
-        p=[0.82, 0.12, 0.06]
-    )
-
-    trips.append({
-        "trip_id": f"TR{10000 + i}",
-        "user_id": np.random.choice(user_ids),
-        "user_type": user_type,
-        "bike_id": np.random.choice(bike_ids),
-        "bike_type": bike_type,
-        "start_station_id": start_st,
-        "end_station_id": end_st,
-        "start_time": start_time.strftime(
-            "%Y-%m-%d %H:%M:%S"
-        ),
-        "end_time": end_time.strftime(
-            "%Y-%m-%d %H:%M:%S"
-        ),
-        "duration_minutes": round(duration, 1),
-        "distance_km": distance,
+
+def id_pools(n_users, n_bikes, rng):
+    """Random user and bike ID numbers (like the original data: USR1000-1199, BK200-349 for small pools)"""
+    users = rng.choice(np.arange(1000, 1000 + max(200, 2 * n_users)), n_users, replace=False)
+    bikes = rng.choice(np.arange(200, 200 + max(150, 2 * n_bikes)), n_bikes, replace=False)
+    return users, bikes
+
+
+def generate_trip_chunk(first_trip, n_trips, n_stations, users, bikes, rng):
+    """One chunk of trips incl. the injected messiness (missing values, zero durations, duplicates)"""
+    stations = 100 + np.arange(n_stations)
+    start_time = (START_DATE
+                  + rng.integers(0, 365, n_trips).astype("timedelta64[D]")
+                  + rng.integers(6, 23, n_trips).astype("timedelta64[h]")
+                  + rng.integers(0, 60, n_trips).astype("timedelta64[m]"))
+    duration = np.maximum(2, rng.exponential(25, n_trips))
+    end_time = start_time + (duration * 60).astype("timedelta64[s]")
+    status = rng.choice(np.array(["completed", "cancelled", None], dtype=object), n_trips, p=[0.82, 0.12, 0.06])
+
+    trips = pd.DataFrame({
+        "trip_id": ids("TR", 10000 + first_trip + np.arange(n_trips)),
+        "user_id": ids("USR", rng.choice(users, n_trips)),
+        "user_type": rng.choice(np.array(["casual", "member"]), n_trips, p=[0.35, 0.65]),
+        "bike_id": ids("BK", rng.choice(bikes, n_trips)),
+        "bike_type": rng.choice(np.array(["classic", "electric"]), n_trips, p=[0.6, 0.4]),
+        "start_station_id": ids("ST", rng.choice(stations, n_trips)),
+        "end_station_id": ids("ST", rng.choice(stations, n_trips)),
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration_minutes": np.round(duration, 1),
+        "distance_km": np.round(rng.uniform(0.5, 15.0, n_trips), 2),
         "status": status,
     })
 
-trips_df = pd.DataFrame(trips)
+    # Inject some messiness (same shares as the original 1500-row file: 30 broken rows, 15 duplicates)
+    broken = rng.choice(n_trips, min(n_trips, n_trips * 30 // 1500), replace=False)
+    part = len(broken) // 3
+    trips.loc[broken[:part], "duration_minutes"] = np.nan
+    trips.loc[broken[part:2 * part], "distance_km"] = np.nan
+    same_time = broken[2 * part:2 * part + part // 2]
+    trips.loc[same_time, "end_time"] = trips.loc[same_time, "start_time"]
 
-# Inject some messiness
-idx = np.random.choice(n_trips, 30, replace=False)
-trips_df.loc[idx[:10], "duration_minutes"] = np.nan
-trips_df.loc[idx[10:20], "distance_km"] = np.nan
-trips_df.loc[idx[20:25], "end_time"] = (trips_df.loc[idx[20:25], "start_time"])
+    dup_rows = trips.iloc[rng.choice(n_trips, n_trips // 100, replace=False)]
+    return pd.concat([trips, dup_rows], ignore_index=True)
 
-dup_rows = trips_df.sample(15)
-trips_df = pd.concat(
-    [trips_df, dup_rows], ignore_index=True
-)
-trips_df.to_csv("trips.csv", index=False)
 
-# --- Maintenance data ---
-maint_types = [
-    "tire_repair", "brake_adjustment",
-    "battery_replacement", "chain_lubrication",
-    "general_inspection"
-]
+def generate_maintenance(n_records, bikes, rng):
+    bike = ids("BK", rng.choice(bikes, n_records))
+    btype = rng.choice(np.array(["classic", "electric"], dtype=object), n_records)
+    mtype = rng.choice(np.array(MAINT_TYPES, dtype=object), n_records)
+    battery = mtype == "battery_replacement"
+    cost = np.where(battery, rng.uniform(80, 250, n_records), rng.uniform(10, 150, n_records)).round(2)
+    btype[battery] = "electric"
 
-records = []
-for i in range(200):
-    bike = np.random.choice(bike_ids)
-    btype = np.random.choice(["classic", "electric"])
-    mtype = np.random.choice(maint_types)
-    cost = round(np.random.uniform(10, 150), 2)
-    if mtype == "battery_replacement":
-        cost = round(np.random.uniform(80, 250), 2)
-        btype = "electric"
-
-    records.append({
-        "record_id": f"MR{5000 + i}",
+    maint = pd.DataFrame({
+        "record_id": ids("MR", 5000 + np.arange(n_records)),
         "bike_id": bike,
         "bike_type": btype,
-        "date": (
-            start_date
-            + timedelta(days=np.random.randint(0, 365))
-        ).strftime("%Y-%m-%d"),
+        "date": (START_DATE + rng.integers(0, 365, n_records).astype("timedelta64[D]")).astype(str),
         "maintenance_type": mtype,
         "cost": cost,
-        "description": f"{mtype.replace('_', ' ').title()}"
-                       f" for bike {bike}",
+        "description": pd.Series(mtype).str.replace("_", " ").str.title() + " for bike " + bike,
     })
+    maint.loc[rng.choice(n_records, n_records * 8 // 200, replace=False), "cost"] = np.nan
+    return maint
+
+
+def write_datasets(output_dir=".", n_trips=1500, n_stations=15, n_users=80, n_bikes=60,
+                   n_maintenance=200, chunk_size=1_000_000, seed=42):
+    """Writes the three source files to 'output_dir', trips in chunks of 'chunk_size' rows"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    generate_stations(n_stations, rng).to_csv(output_dir / "stations.csv", index=False)
+
+    users, bikes = id_pools(n_users, n_bikes, rng)
+    with open(output_dir / "trips.csv", "w", newline="") as f:
+        for first in range(0, n_trips, chunk_size):
+            chunk = generate_trip_chunk(first, min(chunk_size, n_trips - first), n_stations, users, bikes, rng)
+            chunk.to_csv(f, index=False, header=first == 0, date_format=TIME_FORMAT)
+
+    generate_maintenance(n_maintenance, bikes, rng).to_csv(output_dir / "maintenance.csv", index=False)
+    return output_dir
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic CityBike source files")
+    parser.add_argument("--trips", type=int, default=1500)
+    parser.add_argument("--stations", type=int, default=15)
+    parser.add_argument("--users", type=int, default=80)
+    parser.add_argument("--bikes", type=int, default=60)
+    parser.add_argument("--maintenance", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output-dir", default=".")
+    return parser.parse_args(argv)
 
-maint_df = pd.DataFrame(records)
-maint_df.loc[np.random.choice(200, 8, replace=False), "cost"] = np.nan
-maint_df.to_csv("maintenance.csv", index=False)
 
-print("Generated: stations.csv, trips.csv, "
-      "maintenance.csv")
+if __name__ == "__main__":
+    args = parse_args()
+    write_datasets(args.output_dir, args.trips, args.stations, args.users, args.bikes,
+                   args.maintenance, args.chunk_size, args.seed)
+    print("Generated: stations.csv, trips.csv, "
+          "maintenance.csv")
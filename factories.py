@@ -1,5 +1,38 @@
+import numpy as np
+
 from models import ClassicBike, ElectricBike, Station, Trip, CasualUser, MemberUser
 
+
+def _column(df, name, default=None):
+    """Values of a column as a list (or 'default' for every row if the column is missing)"""
+    if name in df.columns:
+        values = df[name]
+        if values.dtype.kind == 'M':
+            # datetime.datetime via NumPy is much faster than building pandas Timestamps
+            return values.to_numpy(dtype='datetime64[us]').tolist()
+        return values.tolist()
+    return [default] * len(df)
+
+
+def _by_mask(mask, selected, others):
+    """Merges two lists of objects back into row order: 'selected' where mask is True"""
+    objects = np.empty(len(mask), dtype=object)
+    objects[mask] = selected
+    objects[~mask] = others
+    return objects
+
+
+def _resolve(ids, id_map):
+    """
+    Object for every ID in 'ids' through an ID map. Every distinct ID is looked up once,
+    the rows then get their (shared) object with one gather over the codes.
+    """
+    unique_ids, codes = np.unique(np.asarray(ids), return_inverse=True)
+    objects = np.empty(len(unique_ids), dtype=object)
+    objects[:] = [id_map.get(key) for key in unique_ids.tolist()]
+    return objects[codes]
+
+
 class BikeFactory:
     @staticmethod
     def create_bike(data: dict):
@@ -21,12 +54,31 @@ class BikeFactory:
                 gear_count=data['gear_count']
             )
 
+    @staticmethod
+    def create_bikes(df):
+        """
+        Creates one Bike per distinct bike_id of a DataFrame (last row wins).
+        The subclass is chosen with one mask on bike_type, missing attribute columns become None.
+        Returns {bike_id: Bike}.
+        """
+        df = df.drop_duplicates('bike_id', keep='last')
+        electric = (df['bike_type'] == 'electric').to_numpy()
+        e_rows, c_rows = df[electric], df[~electric]
+        electric_bikes = [ElectricBike(*row) for row in zip(
+            _column(e_rows, 'bike_id'), _column(e_rows, 'bike_type'),
+            _column(e_rows, 'battery_level'), _column(e_rows, 'max_range_km'))]
+        classic_bikes = [ClassicBike(*row) for row in zip(
+            _column(c_rows, 'bike_id'), _column(c_rows, 'bike_type'), _column(c_rows, 'gear_count'))]
+        bikes = _by_mask(electric, electric_bikes, classic_bikes)
+        return dict(zip(df['bike_id'].tolist(), bikes))
+
+
 class UserFactory:
     @staticmethod
     def create_user(data: dict):
         if (data['user_type'] == 'casual'):
             return CasualUser(
-                user_id=data['user_id'],
+                entity_id=data['user_id'],
                 name=data['name'],
                 email=data['email'],
                 user_type=data['user_type'],
@@ -34,7 +86,7 @@ class UserFactory:
             )
         else:
             return MemberUser(
-                user_id=data['user_id'],
+                entity_id=data['user_id'],
                 name=data['name'],
                 email=data['email'],
                 user_type=data['user_type'],
@@ -42,20 +94,92 @@ class UserFactory:
                 membership_end=data['membership_end'],
                 tier=data['tier']
             )
-        
+
+    @staticmethod
+    def create_users(df):
+        """
+        Creates one User per distinct user_id of a DataFrame (last row wins), casual or member
+        by a mask on user_type. Returns {user_id: User}.
+        """
+        df = df.drop_duplicates('user_id', keep='last')
+        casual = (df['user_type'] == 'casual').to_numpy()
+        c_rows, m_rows = df[casual], df[~casual]
+        casual_users = [CasualUser(*row) for row in zip(
+            _column(c_rows, 'user_id'), _column(c_rows, 'name'), _column(c_rows, 'email'),
+            _column(c_rows, 'user_type'), _column(c_rows, 'day_pass_count'))]
+        member_users = [MemberUser(*row) for row in zip(
+            _column(m_rows, 'user_id'), _column(m_rows, 'name'), _column(m_rows, 'email'),
+            _column(m_rows, 'user_type'), _column(m_rows, 'membership_start'),
+            _column(m_rows, 'membership_end'), _column(m_rows, 'tier'))]
+        users = _by_mask(casual, casual_users, member_users)
+        return dict(zip(df['user_id'].tolist(), users))
+
 
 class TripFactory:
     @staticmethod
     def create_trip(data: dict):
-        return Trip(data)
-    
+        """'data' holds the trip columns plus the already created user, bike and station objects"""
+        return Trip(
+            entity_id=data['trip_id'],
+            user=data.get('user'),
+            bike=data.get('bike'),
+            start_station=data.get('start_station'),
+            end_station=data.get('end_station'),
+            start_time=data['start_time'],
+            end_time=data['end_time'],
+            distance_km=data['distance_km']
+        )
+
+    @staticmethod
+    def create_trips(df, stations: dict = None, bikes: dict = None, users: dict = None):
+        """
+        Creates all Trips of a DataFrame. References point to shared objects from the ID maps
+        (missing maps are built from the trips frame, so every entity exists only once;
+        stations built that way only know their ID). Trips with an ID that is not in a
+        given map get None for that reference.
+        """
+        bikes = bikes if bikes is not None else BikeFactory.create_bikes(df)
+        users = users if users is not None else UserFactory.create_users(df)
+        stations = stations if stations is not None else StationFactory.create_stations_from_ids(
+            np.union1d(df['start_station_id'].to_numpy(), df['end_station_id'].to_numpy()))
+        columns = (
+            _column(df, 'trip_id'),
+            _resolve(df['user_id'], users),
+            _resolve(df['bike_id'], bikes),
+            _resolve(df['start_station_id'], stations),
+            _resolve(df['end_station_id'], stations),
+            _column(df, 'start_time'),
+            _column(df, 'end_time'),
+            _column(df, 'distance_km'),
+        )
+        return [Trip(*row) for row in zip(*columns)]
+
+
 class StationFactory:
     @staticmethod
     def create_station(data: dict):
         return Station(
             entity_id=data['station_id'],
-            name=data['name'],
+            name=data['name'] if 'name' in data else data['station_name'],
             capacity=data['capacity'],
             latitude=data['latitude'],
             longitude=data['longitude']
-        )
\ No newline at end of file
+        )
+
+    @staticmethod
+    def create_stations(df):
+        """Creates all Stations of a DataFrame. Returns {station_id: Station}."""
+        names = _column(df, 'name') if 'name' in df.columns else _column(df, 'station_name')
+        stations = [Station(*row) for row in zip(
+            _column(df, 'station_id'), names, _column(df, 'capacity'),
+            _column(df, 'latitude'), _column(df, 'longitude'))]
+        return dict(zip(_column(df, 'station_id'), stations))
+
+    @staticmethod
+    def create_stations_from_ids(station_ids):
+        """
+        Creates placeholder Stations for bare IDs (e.g. the IDs of a trips frame without a
+        station table): the ID doubles as the name, capacity and position are unknown (None).
+        """
+        return {station_id: Station(station_id, str(station_id), None, None, None)
+                for station_id in station_ids}
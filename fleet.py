@@ -0,0 +1,171 @@
+"""
+Fleet health index: one row per bike_id with usage, maintenance history and the distance
+ridden since the last maintenance (overall and per maintenance_type).
+Built with grouped sums and one as-of join of the maintenance dates against the cumulative
+distance of every bike, so no per-row dictionaries over the trips table are needed.
+"""
+
+import numpy
+import pandas
+
+
+class FleetIndex:
+    """
+    Per-bike table 'bikes' indexed by bike_id with the columns
+      bike_type, trips, distance_km, minutes                     (from the trips)
+      maint_count, maint_cost, last_maintenance                  (all maintenance)
+      count_<type>, cost_<type>, last_<type>                     (per maintenance_type)
+      km_since_maintenance, km_since_<type>                      (distance ridden after the last record)
+    Bikes that were never maintained count their whole distance as 'since'.
+    """
+
+    def __init__(self, bikes, maintenance_types):
+        self.bikes = bikes
+        self.maintenance_types = list(maintenance_types)
+
+    @classmethod
+    def build(cls, trips, maintenance):
+        types = [str(t) for t in pandas.unique(maintenance['maintenance_type'].dropna()) if str(t) != 'Unknown']
+        types.sort()
+
+        # usage per bike, bike_type of its last trip
+        usage = trips.groupby('bike_id', observed=True).agg(
+            trips=('bike_id', 'size'), distance_km=('distance_km', 'sum'), minutes=('duration_minutes', 'sum'))
+        last_type = trips.drop_duplicates('bike_id', keep='last').set_index('bike_id')['bike_type']
+        maint_type = maintenance.drop_duplicates('bike_id', keep='last').set_index('bike_id')['bike_type']
+        bike_ids = usage.index.union(maintenance['bike_id'].dropna().unique())
+        bikes = usage.reindex(bike_ids, fill_value=0)
+        bikes.index.name = 'bike_id'
+        bike_type = last_type.astype(object).reindex(bike_ids)
+        bikes.insert(0, 'bike_type', bike_type.fillna(maint_type.astype(object).reindex(bike_ids)).fillna('Unknown'))
+
+        # maintenance count and cost, overall and per type (one grouped pass)
+        per_type = maintenance.groupby(['bike_id', 'maintenance_type'], observed=True).agg(
+            count=('cost', 'size'), cost=('cost', 'sum'), last=('date', 'max'))
+        bikes['maint_count'] = per_type['count'].groupby(level='bike_id').sum().reindex(bike_ids, fill_value=0)
+        bikes['maint_cost'] = per_type['cost'].groupby(level='bike_id').sum().reindex(bike_ids, fill_value=0.0)
+        bikes['last_maintenance'] = per_type['last'].groupby(level='bike_id').max().reindex(bike_ids)
+        counts = per_type['count'].unstack('maintenance_type', fill_value=0)
+        costs = per_type['cost'].unstack('maintenance_type', fill_value=0.0)
+        lasts = per_type['last'].unstack('maintenance_type')
+        for mtype in types:
+            bikes[f'count_{mtype}'] = counts[mtype].reindex(bike_ids, fill_value=0)
+            bikes[f'cost_{mtype}'] = costs[mtype].reindex(bike_ids, fill_value=0.0)
+            bikes[f'last_{mtype}'] = lasts[mtype].reindex(bike_ids)
+
+        index = cls(bikes, types)
+        index._set_km_since(trips)
+        return index
+
+    def _set_km_since(self, trips):
+        """km_since_* = total distance - cumulative distance at the last maintenance (as-of join)"""
+        rides = trips[['bike_id', 'end_time', 'distance_km']].dropna(subset=['end_time'])
+        rides = rides.sort_values('end_time', kind='stable')
+        rides = rides.assign(cum_km=rides.groupby('bike_id', observed=True)['distance_km'].cumsum().fillna(0))
+        total = self.bikes['distance_km']
+
+        for mtype in [None] + self.maintenance_types:
+            last_col = 'last_maintenance' if mtype is None else f'last_{mtype}'
+            since_col = 'km_since_maintenance' if mtype is None else f'km_since_{mtype}'
+            last = self.bikes[last_col].dropna()
+            done = pandas.DataFrame({'bike_id': last.index.to_numpy(), 'date': last.to_numpy()}).sort_values('date')
+            done['date'] = done['date'].astype(rides['end_time'].dtype)
+            at_maintenance = pandas.merge_asof(done, rides[['bike_id', 'end_time', 'cum_km']],
+                                               left_on='date', right_on='end_time', by='bike_id',
+                                               direction='backward', allow_exact_matches=False)
+            ridden_before = pandas.Series(at_maintenance['cum_km'].fillna(0).to_numpy(),
+                                          index=at_maintenance['bike_id'].to_numpy())
+            self.bikes[since_col] = total - ridden_before.reindex(self.bikes.index, fill_value=0)
+
+    def update(self, new_trips=None, new_maintenance=None):
+        """
+        Refreshes the index with records that arrived since it was built, without the history.
+        Assumes the new records are newer than the old ones: new maintenance resets the
+        'since' counters of its bikes, then the distance of new trips that ended after the
+        last maintenance is added.
+        """
+        if new_maintenance is not None and len(new_maintenance):
+            fresh = FleetIndex.build(_no_trips(new_maintenance), new_maintenance)
+            self._add_maintenance(fresh)
+        if new_trips is not None and len(new_trips):
+            self._add_trips(new_trips)
+        return self
+
+    def _add_maintenance(self, fresh):
+        new = fresh.bikes
+        self._add_bikes(new.index, new['bike_type'])
+        for mtype in fresh.maintenance_types:
+            if mtype not in self.maintenance_types:
+                self.maintenance_types.append(mtype)
+                self.bikes[f'count_{mtype}'] = 0
+                self.bikes[f'cost_{mtype}'] = 0.0
+                self.bikes[f'last_{mtype}'] = pandas.Series(pandas.NaT, index=self.bikes.index,
+                                                            dtype=self.bikes['last_maintenance'].dtype)
+                self.bikes[f'km_since_{mtype}'] = self.bikes['distance_km']
+
+        ids = new.index
+        for column in ['maint_count', 'maint_cost'] + \
+                [f'{c}_{t}' for t in fresh.maintenance_types for c in ('count', 'cost')]:
+            self.bikes.loc[ids, column] += new[column]
+        for mtype in [None] + fresh.maintenance_types:
+            last_col = 'last_maintenance' if mtype is None else f'last_{mtype}'
+            since_col = 'km_since_maintenance' if mtype is None else f'km_since_{mtype}'
+            serviced = new[last_col].dropna()
+            self.bikes.loc[serviced.index, last_col] = serviced
+            self.bikes.loc[serviced.index, since_col] = 0.0
+
+    def _add_trips(self, trips):
+        usage = trips.groupby('bike_id', observed=True).agg(
+            trips=('bike_id', 'size'), distance_km=('distance_km', 'sum'), minutes=('duration_minutes', 'sum'))
+        last_type = trips.drop_duplicates('bike_id', keep='last').set_index('bike_id')['bike_type']
+        self._add_bikes(usage.index, last_type.astype(object))
+        for column in ('trips', 'distance_km', 'minutes'):
+            self.bikes.loc[usage.index, column] += usage[column]
+        self.bikes.loc[last_type.index, 'bike_type'] = last_type.astype(object)
+
+        end_times = trips['end_time'].to_numpy(dtype='datetime64[ns]')
+        distances = trips['distance_km'].fillna(0).to_numpy()
+        for mtype in [None] + self.maintenance_types:
+            last_col = 'last_maintenance' if mtype is None else f'last_{mtype}'
+            since_col = 'km_since_maintenance' if mtype is None else f'km_since_{mtype}'
+            last = self.bikes[last_col].reindex(trips['bike_id']).to_numpy(dtype='datetime64[ns]')
+            after = numpy.isnat(last) | (end_times >= last)
+            added = pandas.Series(distances * after).groupby(trips['bike_id'].to_numpy()).sum()
+            self.bikes.loc[added.index, since_col] += added
+
+    def _add_bikes(self, bike_ids, bike_types):
+        missing = bike_ids.difference(self.bikes.index)
+        if not len(missing):
+            return
+        rows = pandas.DataFrame(index=missing, columns=self.bikes.columns)
+        for column, dtype in self.bikes.dtypes.items():
+            if pandas.api.types.is_datetime64_any_dtype(dtype):
+                rows[column] = pandas.Series(pandas.NaT, index=missing, dtype=dtype)
+            elif column != 'bike_type':
+                rows[column] = pandas.Series(0, index=missing, dtype=dtype)
+        rows['bike_type'] = bike_types.reindex(missing).fillna('Unknown').to_numpy()
+        self.bikes = pandas.concat([self.bikes, rows])
+        self.bikes.index.name = 'bike_id'
+
+    def due(self, km, maintenance_type=None):
+        """Bikes that rode more than 'km' since their last maintenance (of the given type), most km first"""
+        column = 'km_since_maintenance' if maintenance_type is None else f'km_since_{maintenance_type}'
+        if column not in self.bikes.columns:
+            raise KeyError(f"Unknown maintenance type: {maintenance_type}")
+        over = self.bikes[self.bikes[column] > km]
+        return over.sort_values(column, ascending=False, kind='stable')
+
+    def cost_by_bike_type(self):
+        """Maintenance cost per bike_type (the bike_type of every bike comes from its last trip)"""
+        return self.bikes.groupby('bike_type')['maint_cost'].sum().to_dict()
+
+
+def _no_trips(maintenance):
+    """Empty trips frame with the columns FleetIndex.build needs"""
+    return pandas.DataFrame({
+        'bike_id': pandas.Series(dtype=maintenance['bike_id'].dtype),
+        'bike_type': pandas.Series(dtype=object),
+        'end_time': pandas.Series(dtype=maintenance['date'].dtype),
+        'duration_minutes': pandas.Series(dtype='float64'),
+        'distance_km': pandas.Series(dtype='float64'),
+    })
@@ -0,0 +1,190 @@
+"""
+Station flow and rebalancing.
+Trips become a time-sorted stream of events (-1 bike at the start station, +1 at the end station).
+The occupancy of every station after every event is a per-station cumulative sum, computed with
+one stable sort by station instead of a loop over events.
+"""
+
+import numpy
+import pandas
+
+from schema import format_ids
+
+
+class StationFlow:
+    """
+    Running bike count of every station, started at 'initial_fill' * capacity.
+    Events are stored in time order: times (int64 ns), codes (station codes of the registry),
+    deltas (-1/+1) and occupancy (bikes at the station after the event).
+    New trips that start after the last stored event are appended without recomputing the history.
+    """
+
+    def __init__(self, registry, initial_fill=0.5):
+        self.registry = registry
+        stations = registry.stations.iloc[registry.rows]
+        self.capacity = pandas.to_numeric(stations['capacity'], errors='coerce').fillna(0).to_numpy(numpy.int64)
+        self.start_levels = numpy.floor(self.capacity * initial_fill).astype(numpy.int64)
+        # bikes at every station after the last event
+        self.levels = self.start_levels.copy()
+
+        self.times = numpy.empty(0, dtype=numpy.int64)
+        self.codes = numpy.empty(0, dtype=numpy.int32)
+        self.deltas = numpy.empty(0, dtype=numpy.int8)
+        self.occupancy = numpy.empty(0, dtype=numpy.int64)
+
+    @classmethod
+    def from_trips(cls, trips, registry, initial_fill=0.5):
+        flow = cls(registry, initial_fill)
+        flow.add_trips(trips)
+        return flow
+
+    def __len__(self):
+        return len(self.times)
+
+    def trip_events(self, trips):
+        """
+        (times, codes, deltas) of a trips frame sorted by time. At the same timestamp arrivals
+        come before departures. Trips with unknown stations or missing times give no event.
+        """
+        ends = self._events(trips['end_time'], trips['end_station_id'], 1)
+        starts = self._events(trips['start_time'], trips['start_station_id'], -1)
+        times, codes, deltas = (numpy.concatenate([e, s]) for e, s in zip(ends, starts))
+        order = numpy.argsort(times, kind='stable')
+        return times[order], codes[order], deltas[order]
+
+    def _events(self, times, station_ids, delta):
+        times = numpy.asarray(times, dtype='datetime64[ns]')
+        codes = self.registry.codes(station_ids)
+        valid = (codes >= 0) & ~numpy.isnat(times)
+        return (times[valid].astype(numpy.int64), codes[valid].astype(numpy.int32),
+                numpy.full(int(valid.sum()), delta, dtype=numpy.int8))
+
+    def add_trips(self, trips):
+        """Adds the events of new trips; returns the number of added events"""
+        times, codes, deltas = self.trip_events(trips)
+        if not len(times):
+            return 0
+
+        if len(self.times) and times[0] < self.times[-1]:
+            # events before the end of the stored stream: rebuild the whole stream
+            times = numpy.concatenate([self.times, times])
+            codes = numpy.concatenate([self.codes, codes])
+            deltas = numpy.concatenate([self.deltas, deltas])
+            order = numpy.argsort(times, kind='stable')
+            self.times, self.codes, self.deltas = times[order], codes[order], deltas[order]
+            self.occupancy, self.levels = self._running_levels(self.codes, self.deltas, self.start_levels)
+        else:
+            occupancy, self.levels = self._running_levels(codes, deltas, self.levels)
+            self.times = numpy.concatenate([self.times, times])
+            self.codes = numpy.concatenate([self.codes, codes])
+            self.deltas = numpy.concatenate([self.deltas, deltas])
+            self.occupancy = numpy.concatenate([self.occupancy, occupancy])
+        return len(times)
+
+    @staticmethod
+    def _running_levels(codes, deltas, base_levels):
+        """
+        Occupancy after every event (events in time order) and the final level per station.
+        Grouped cumulative sum: events are stably sorted by station, the running total of the
+        preceding stations is subtracted at every group start.
+        """
+        order = numpy.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        running = numpy.cumsum(deltas[order], dtype=numpy.int64)
+        starts = numpy.flatnonzero(numpy.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        before_group = numpy.r_[0, running][starts]
+        group_sizes = numpy.diff(numpy.r_[starts, len(codes)])
+        running -= numpy.repeat(before_group, group_sizes)
+
+        occupancy = numpy.empty(len(codes), dtype=numpy.int64)
+        occupancy[order] = running + base_levels[sorted_codes]
+        levels = base_levels + numpy.bincount(codes, weights=deltas, minlength=len(base_levels)).astype(numpy.int64)
+        return occupancy, levels
+
+    def current_levels(self):
+        """Bikes at every station after the last event (station_id, name, capacity, bikes)"""
+        return pandas.DataFrame({
+            'station_id': format_ids(self.registry.index, 'station_id'),
+            'station_name': self.registry.names.to_numpy(),
+            'capacity': self.capacity,
+            'bikes': self.levels,
+        })
+
+    def breaches(self):
+        """Events after which a station is empty-and-short (below 0) or over capacity"""
+        capacity = self.capacity[self.codes]
+        empty = self.occupancy < 0
+        full = self.occupancy > capacity
+        rows = numpy.flatnonzero(empty | full)
+        codes = self.codes[rows]
+        return pandas.DataFrame({
+            'time': self.times[rows].astype('datetime64[ns]'),
+            'station_id': format_ids(self.registry.index[codes], 'station_id'),
+            'station_name': self.registry.names.to_numpy()[codes],
+            'bikes': self.occupancy[rows],
+            'capacity': capacity[rows],
+            'kind': numpy.where(empty[rows], 'empty', 'full'),
+        })
+
+    def hourly_rebalancing(self, only_demand=True):
+        """
+        Net flow and rebalancing demand per station and hour, assuming the reported demand
+        is carried out at the start of that hour: the bikes added or removed shift the
+        station's level for all later hours, so a deficit is only reported once.
+        min_bikes/max_bikes: level range in the hour including the earlier rebalancing,
+        bikes_to_add: bikes needed so the station does not go below 0 in that hour,
+        bikes_to_remove: bikes to take away so it does not go over capacity.
+        """
+        columns = ['hour', 'station_id', 'station_name', 'net_flow', 'min_bikes', 'max_bikes',
+                   'bikes_to_add', 'bikes_to_remove']
+        if not len(self.times):
+            return pandas.DataFrame(columns=columns)
+
+        hours = self.times // (3600 * 10**9)
+        # the events are in time order, so a stable sort by station keeps the hours sorted
+        order = numpy.argsort(self.codes, kind='stable')
+        codes, hours, occupancy = self.codes[order], hours[order], self.occupancy[order]
+        starts = numpy.flatnonzero(numpy.r_[True, (codes[1:] != codes[:-1]) | (hours[1:] != hours[:-1])])
+
+        group_codes = codes[starts]
+        group_hours = hours[starts]
+        low = numpy.minimum.reduceat(occupancy, starts)
+        high = numpy.maximum.reduceat(occupancy, starts)
+        to_add, to_remove, shift = self._rebalance(group_codes, group_hours, low, high)
+        result = pandas.DataFrame({
+            'hour': group_hours.astype('datetime64[h]').astype('datetime64[ns]'),
+            'station_id': format_ids(self.registry.index[group_codes], 'station_id'),
+            'station_name': self.registry.names.to_numpy()[group_codes],
+            'net_flow': numpy.add.reduceat(self.deltas[order].astype(numpy.int64), starts),
+            'min_bikes': low + shift,
+            'max_bikes': high + shift,
+            'bikes_to_add': to_add,
+            'bikes_to_remove': to_remove,
+        })
+        if only_demand:
+            result = result[(result['bikes_to_add'] > 0) | (result['bikes_to_remove'] > 0)]
+        return result.sort_values(['hour', 'station_id'], kind='stable').reset_index(drop=True)
+
+    def _rebalance(self, codes, hours, low, high):
+        """
+        Bikes to add/remove per (station, hour) group and the level shift of the group from
+        the rebalancing of earlier hours. The shift of a station depends on its previous hour,
+        so the groups are walked hour by hour (vectorised over the stations of an hour).
+        """
+        by_hour = numpy.argsort(hours, kind='stable')
+        bounds = numpy.flatnonzero(numpy.r_[True, hours[by_hour][1:] != hours[by_hour][:-1], True])
+        to_add = numpy.zeros(len(codes), dtype=numpy.int64)
+        to_remove = numpy.zeros(len(codes), dtype=numpy.int64)
+        shift = numpy.zeros(len(codes), dtype=numpy.int64)
+        station_shift = numpy.zeros(len(self.capacity), dtype=numpy.int64)
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            rows = by_hour[first:last]
+            hour_codes = codes[rows]
+            current = station_shift[hour_codes]
+            added = numpy.maximum(-(low[rows] + current), 0)
+            removed = numpy.maximum(high[rows] + current - self.capacity[hour_codes], 0)
+            shift[rows] = current
+            to_add[rows] = added
+            to_remove[rows] = removed
+            station_shift[hour_codes] = current + added - removed
+        return to_add, to_remove, shift
@@ -0,0 +1,178 @@
+"""
+Incremental (append-only) statistics.
+The mergeable TripAggregates are kept on disk together with the set of already seen trip IDs,
+so a new batch of trips only updates the state instead of re-aggregating the whole history.
+"""
+
+import json
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy
+import pandas
+
+from activity import UserActivity
+from aggregation import TripAggregates
+from cube import RollupCube
+from schema import UNKNOWN_ID
+
+# format of the state files, bump when they change (older states have to be rebuilt)
+STATE_VERSION = 6
+
+
+class TripIdSet:
+    """
+    Compact on-disk set of trip IDs: one sorted int64 numpy array (8 bytes per trip).
+    Parsed int IDs are stored as they are, other IDs as their 64-bit hash.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path) if path is not None else None
+        if self.path is not None and self.path.exists():
+            self.keys = numpy.load(self.path, mmap_mode='r')
+        else:
+            self.keys = numpy.empty(0, dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def to_keys(trip_ids):
+        if pandas.api.types.is_integer_dtype(trip_ids):
+            return trip_ids.to_numpy(dtype=numpy.int64)
+        return pandas.util.hash_pandas_object(trip_ids, index=False).to_numpy().view(numpy.int64)
+
+    def contains(self, keys):
+        """Boolean mask: which of 'keys' are already in the set"""
+        if not len(self.keys):
+            return numpy.zeros(len(keys), dtype=bool)
+        pos = numpy.minimum(numpy.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return self.keys[pos] == keys
+
+    def add(self, keys):
+        new_keys = numpy.unique(keys)
+        self.keys = numpy.insert(numpy.asarray(self.keys), numpy.searchsorted(self.keys, new_keys), new_keys)
+
+    def save(self, path=None):
+        """Writes the set to 'path' (default: the file it was loaded from)"""
+        path = Path(path) if path is not None else self.path
+        # the old file may still be memory-mapped, so write a new file and swap it in
+        tmp_path = path.with_name(path.stem + '.tmp.npy')
+        numpy.save(tmp_path, numpy.asarray(self.keys))
+        os.replace(tmp_path, path)
+        self.path = path
+
+
+class IncrementalStats:
+    """
+    Aggregate state of all trips applied so far, stored in 'state_dir':
+      aggregates.<generation>.pkl   - TripAggregates (counts per station, route, user, time slot,
+                                      sums, bikes, time range)
+      trip_ids.<generation>.npy     - TripIdSet of the applied trips
+      activity.<generation>.npz     - UserActivity (user x month matrix) of the applied trips
+      state.json                    - generation, number of applied batches/trips, versions
+      cube/                         - memory-mapped RollupCube of the applied trips
+    Every batch writes the files of a new generation and commits them together by replacing
+    state.json, so an interrupted batch leaves the previous state intact and can be applied again.
+    The cube is updated in place after the commit; if that is interrupted it no longer matches
+    the state and is dropped (states created before the cube existed do not get one either).
+    """
+
+    def __init__(self, state_dir, rules_version):
+        self.state_dir = Path(state_dir)
+        self.rules_version = rules_version
+        self.meta = {"state_version": STATE_VERSION, "rules_version": rules_version, "generation": 0,
+                     "batches": 0, "trips": 0, "skipped_duplicates": 0}
+        self.aggregates = TripAggregates()
+        self.activity = None
+        self.trip_ids = TripIdSet(None)
+
+        meta_path = self.state_dir / "state.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            if meta.get("state_version") != STATE_VERSION:
+                raise ValueError(
+                    f"Incremental state in {self.state_dir} has format v{meta.get('state_version', 1)}, "
+                    f"current is v{STATE_VERSION}. Delete it to rebuild.")
+            if meta.get("rules_version") != rules_version:
+                raise ValueError(
+                    f"Incremental state in {self.state_dir} was built with cleaning rules "
+                    f"v{meta.get('rules_version')}, current is v{rules_version}. Delete it to rebuild.")
+            self.meta = meta
+            with open(self._path("aggregates", ".pkl"), "rb") as f:
+                self.aggregates = pickle.load(f)
+            self.trip_ids = TripIdSet(self._path("trip_ids", ".npy"))
+            if self._path("activity", ".npz").exists():
+                self.activity = UserActivity.load(self._path("activity", ".npz"))
+
+        cube_dir = self.state_dir / "cube"
+        self.cube = None
+        if (cube_dir / "meta.json").exists():
+            cube = RollupCube.open(cube_dir)
+            if cube.complete and cube.generation == self.meta["generation"]:
+                self.cube = cube
+            else:
+                print(f"Rollup cube in {cube_dir} does not match the incremental state "
+                      f"(interrupted update), it is no longer kept.")
+                shutil.rmtree(cube_dir)
+
+    def _path(self, name, suffix, generation=None):
+        generation = self.meta["generation"] if generation is None else generation
+        return self.state_dir / f"{name}.{generation}{suffix}"
+
+    def apply(self, trips, tiers=None):
+        """
+        Adds a batch of cleaned trips. Trips whose trip_id was already applied (in this or an
+        earlier batch) are skipped. 'tiers' are the member tiers for the revenue per plan.
+        Returns the number of new trips.
+        """
+        keys = TripIdSet.to_keys(trips['trip_id'])
+        # unknown IDs cannot be de-duplicated, they are always counted
+        unknown = keys == UNKNOWN_ID
+        new = unknown | (~pandas.Series(keys).duplicated().to_numpy() & ~self.trip_ids.contains(keys))
+        new_trips = trips[new]
+        first_batch = self.meta["trips"] == 0
+
+        # sequence numbers continue after the trips of the earlier batches
+        positions = numpy.arange(len(new_trips)) + self.meta["trips"]
+        self.aggregates = self.aggregates.merge(TripAggregates.from_trips(new_trips, positions, tiers))
+        self.trip_ids.add(keys[new & ~unknown])
+        if self.activity is not None:
+            self.activity = self.activity.extend(new_trips)
+        elif first_batch:
+            self.activity = UserActivity.from_trips(new_trips)
+
+        self.meta["batches"] += 1
+        self.meta["trips"] += len(new_trips)
+        self.meta["skipped_duplicates"] += len(trips) - len(new_trips)
+        self.save()
+
+        if self.cube is not None:
+            self.cube.update(new_trips, self.meta["generation"])
+        elif first_batch:
+            self.cube = RollupCube.build(new_trips, self.state_dir / "cube", self.meta["generation"])
+        return len(new_trips)
+
+    def save(self):
+        """Writes the files of the next generation and commits them with one replace of state.json"""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        old_generation = self.meta["generation"]
+        generation = old_generation + 1
+
+        with open(self._path("aggregates", ".pkl", generation), "wb") as f:
+            pickle.dump(self.aggregates, f)
+        self.trip_ids.save(self._path("trip_ids", ".npy", generation))
+        if self.activity is not None:
+            self.activity.save(self._path("activity", ".npz", generation))
+
+        meta = dict(self.meta, generation=generation)
+        tmp_path = self.state_dir / "state.tmp"
+        tmp_path.write_text(json.dumps(meta, indent=2))
+        os.replace(tmp_path, self.state_dir / "state.json")
+        self.meta = meta
+
+        # the previous generation is no longer referenced
+        for name, suffix in (("aggregates", ".pkl"), ("trip_ids", ".npy"), ("activity", ".npz")):
+            self._path(name, suffix, old_generation).unlink(missing_ok=True)
@@ -1,48 +1,77 @@
 """
 Main entry point for the CityBike Analytics Platform.
 Orchestrates data loading, processing, and analysis.
+
+Usage: python main.py [ingest | report | charts | export | serve | all] [--columnar] [--profile]
+                      [--profile-memory] [--metrics-file FILE] [--metrics-port PORT] [--port PORT]
+Without a command the full pipeline ('all') runs. Heavy modules (pandas, matplotlib)
+are imported only by the steps that need them.
 """
 
-from analyzer import BikeShare
-from numerical import NumericalProcessor
-from algorithms import Algorithms
+import argparse
+import threading
 from pathlib import Path
 
-def main():
+from metrics import METRICS
+from utils import StepProfiler
+
+OUTPUT_DIR = Path(__file__).resolve().parent / "output"
+
+COMMANDS = ("ingest", "report", "charts", "export", "serve", "all")
+
+
+def load_system(use_cache=True):
     # 1. Initialize System and Load Data
+    # (cleaned tables come from the columnar cache if the sources did not change)
+    from analyzer import BikeShare
+
     print("Step 1: Initializing BikeShare System...")
     system = BikeShare()
-    system.initialize_system() # This loads stations, trips, and maintenance
+    system.initialize_system(use_cache=use_cache) # This loads stations, trips, and maintenance
+    return system
+
 
+def process_numerical(system):
     # 2. Advanced Numerical Processing (NumPy)
-    # Example: Calculate distance for the first few trips as a test
+    # Haversine distance between the start and end station of every trip
+    # (station x station matrix + one gather through the station codes)
     print("\nStep 2: Processing Numerical Data...")
     if system.trips is not None and system.stations is not None:
-        # Let's take the first trip and calculate Euclidean distance
-        # as a proof of concept for the capstone requirements
-        sample_trip = system.trips.iloc[0]
-        # In a real scenario, we would map station IDs to coordinates
-        # This is where NumericalProcessor.calculate_euclidean_distance would be used
+        distance_check = system.validate_trip_distances()
+        print(f"Checked distances of {len(distance_check)} trips: "
+              f"{int(distance_check['suspicious'].sum())} shorter than the straight line between stations.")
         print("Numerical processing engine: READY")
 
+
+def sort_trips(system):
     # 3. Custom Sorting (Algorithms)
+    from algorithms import Algorithms
+
     print("\nStep 3: Running Custom Sorting Algorithms...")
-    # Convert a portion of trips to list of dicts for our custom Merge Sort
-    trips_list = system.trips.head(10).to_dict('records')
-    sorted_trips = Algorithms.merge_sort(trips_list, key_func=lambda x: x['distance_km'])
-    print(f"Sorted {len(sorted_trips)} sample trips by distance using Merge Sort.")
+    # All trips are sorted by distance: the NumPy path of Algorithms returns
+    # stable argsort indices for the DataFrame column (fast enough for millions of trips)
+    sorted_trips = Algorithms.sort_frame(system.trips, 'distance_km')
+    print(f"Sorted {len(sorted_trips)} trips by distance using a stable sort (NumPy path).")
+
 
+def export_data(system, output_dir, columnar_export=False):
     # 4. Save Cleaned Data (Requirement from Milestone 3)
+    from cache import save_table
+
     print("\nStep 4: Saving Cleaned Datasets...")
-    output_dir = Path(__file__).resolve().parent / "output"
     output_dir.mkdir(exist_ok=True)
     
-    system.trips.to_csv(output_dir / "trips_clean.csv", index=False)
-    system.stations.to_csv(output_dir / "stations.csv", index=False) # In reality, stations are already clean
+    # trips_clean is also written as Feather if requested (typed, fast to load again)
+    export_formats = ("csv", "feather") if columnar_export else ("csv",)
+    save_table(system.trips, output_dir / "trips_clean", export_formats)
+    save_table(system.stations, output_dir / "stations") # In reality, stations are already clean
     print(f"Cleaned data saved to {output_dir}")
 
+
+def write_report(system, output_dir):
     # 5. Generate Business Report
     print("\nStep 5: Generating Business Report...")
+    output_dir.mkdir(exist_ok=True)
     report = system.generate_business_stats()
     
     with open(output_dir / "summary_report.txt", "w") as f:
@@ -82,24 +111,108 @@ def main():
         f.write("\n10. Top Routes (Station Name -> Station Name):\n")
         for idx, row in report['top_routes'].head(10).iterrows():
             f.write(f"   - {row['start_name']} -> {row['end_name']}: {row['count']}\n")
+
+        f.write("\n11. Revenue by Plan (standard tariff):\n")
+        for plan, revenue in report['revenue_by_plan'].items():
+            f.write(f"   - {plan}: ${revenue:.2f}\n")
+        f.write(f"   - total: ${sum(report['revenue_by_plan'].values()):.2f}\n")
+        if report.get('unpriced_trips'):
+            f.write(f"   - not priced (unknown user type): {report['unpriced_trips']} trips\n")
         
     print("Report generated: output/summary_report.txt")
 
+
+def render_charts(system, output_dir):
     # 6. Visualization Phase
     print("\nStep 6: Generating Visualizations...")
     from visualization import Visualizer
     viz = Visualizer(output_path=output_dir / "figures")
     
-    viz.plot_bike_types(system.trips)
-    viz.plot_peak_hours(system.trips)
-    viz.plot_top_stations(system.trips, system.stations)
-    viz.plot_trip_distances(system.trips)
+    # charts are drawn in parallel from the aggregates the report uses too, unchanged charts are skipped
+    charts = viz.render_all(system.trips, system.stations, system.station_registry,
+                            aggregates=system.trip_aggregates)
+    skipped = [name for name, state in charts.items() if state == "skipped"]
+    if skipped:
+        print(f"Unchanged charts skipped: {', '.join(skipped)}")
+    empty = [name for name, state in charts.items() if state == "no data"]
+    if empty:
+        print(f"Charts without data: {', '.join(empty)}")
     
     print(f"Visualizations saved to: output/figures/")
-    print("\n✅ ALL MILESTONES COMPLETE!")
 
-    print("\n--- Capstone Project: Data Processing Phase Complete ---")
-    print("Next step: Data Visualization & Business Questions.")
+
+def main(command="all", columnar_export=False, profile=False, output_dir=OUTPUT_DIR,
+         metrics_file=None, metrics_port=None, port=8080, profile_memory=False):
+    # tracemalloc distorts wall times, so peak memory is only traced when asked for
+    profiler = StepProfiler(enabled=profile or profile_memory, trace_memory=profile_memory)
+    if metrics_file or metrics_port:
+        # stage timers and row counts per cleaning rule (see metrics.py)
+        METRICS.enable(jsonl_path=metrics_file)
+    server = METRICS.serve(metrics_port) if metrics_port else None
+
+    with profiler.step("load"):
+        system = load_system()
+
+    if command == "all":
+        with profiler.step("numerical"):
+            process_numerical(system)
+        with profiler.step("sort"):
+            sort_trips(system)
+    if command in ("export", "all"):
+        with profiler.step("export"):
+            export_data(system, output_dir, columnar_export)
+    if command in ("report", "all"):
+        with profiler.step("report"):
+            write_report(system, output_dir)
+    if command in ("charts", "all"):
+        with profiler.step("charts"):
+            render_charts(system, output_dir)
+    if command == "serve":
+        # dashboard queries as JSON, the tables stay in memory (see server.py)
+        from server import serve
+        serve(system, port=port)
+
+    if command == "all":
+        print("\n✅ ALL MILESTONES COMPLETE!")
+
+        print("\n--- Capstone Project: Data Processing Phase Complete ---")
+        print("Next step: Data Visualization & Business Questions.")
+
+    profiler.close()
+    if profile or profile_memory:
+        print(profiler.report())
+
+    if server is not None:
+        print(f"\nMetrics served at http://127.0.0.1:{metrics_port}/metrics (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CityBike Analytics Platform")
+    parser.add_argument("command", nargs="?", default="all", choices=COMMANDS,
+                        help="ingest: clean the sources and fill the cache, report: summary report, "
+                             "charts: figures, export: cleaned CSV/Feather files, "
+                             "serve: JSON query server for dashboards, all: everything (default)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="also save trips_clean in the columnar Feather format")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the wall time and peak RSS of every step")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also trace the peak Python/NumPy allocations of every step (tracemalloc, slows the steps down)")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="append stage timers and rows per cleaning rule to FILE as JSON lines")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve the metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="port of the query server (serve command)")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    main(command=args.command, columnar_export=args.columnar, profile=args.profile,
+         metrics_file=args.metrics_file, metrics_port=args.metrics_port, port=args.port,
+         profile_memory=args.profile_memory)
@@ -0,0 +1,186 @@
+"""
+Instrumentation of the pipeline: stage timers, row counts per cleaning rule and peak memory.
+Everything is off by default; disabled calls return after one attribute check, so the
+instrumentation can stay in the hot paths. Results can be written as JSON lines and served
+in the Prometheus text format.
+Only standard library imports here, so the CLI can use it before pandas is loaded.
+"""
+
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import peak_rss_mb
+
+PREFIX = "citybike"
+
+
+class Metrics:
+    """
+    Collects
+      stage timers     {(stage, labels): [calls, total seconds, max seconds, peak traced bytes]}
+      cleaning rules   {(file, rule): [rows in, rows out]}
+    With a 'jsonl_path' every record is also appended to that file as one JSON object per line.
+    With trace_memory=True the peak of tracemalloc during a stage is recorded (nested stages
+    report the peak since the start of the outermost stage); tracemalloc slows pandas down,
+    so it is off by default and only the peak RSS of the process is exported.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.jsonl_path = None
+        self.timers = {}
+        self.rules = {}
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def enable(self, jsonl_path=None, trace_memory=False):
+        self.enabled = True
+        self.jsonl_path = jsonl_path
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.rules.clear()
+
+    def timer(self, stage, **labels):
+        """Context manager that times a stage (a no-op context when disabled)"""
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(stage, labels)
+
+    @contextmanager
+    def _timer(self, stage, labels):
+        outermost = not self._active
+        self._active.add(stage)
+        if self.trace_memory and outermost:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._active.discard(stage)
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+            key = (stage, tuple(sorted(labels.items())))
+            with self._lock:
+                timer = self.timers.setdefault(key, [0, 0.0, 0.0, 0])
+                timer[0] += 1
+                timer[1] += elapsed
+                timer[2] = max(timer[2], elapsed)
+                timer[3] = max(timer[3], peak)
+            self._write({"type": "timer", "stage": stage, "labels": labels,
+                         "seconds": elapsed, "peak_traced_bytes": peak or None})
+
+    def rule(self, file_name, rule, rows_in, rows_out):
+        """Rows before and after one cleaning rule of a file"""
+        if not self.enabled:
+            return
+        with self._lock:
+            counts = self.rules.setdefault((str(file_name), rule), [0, 0])
+            counts[0] += int(rows_in)
+            counts[1] += int(rows_out)
+        self._write({"type": "rule", "file": str(file_name), "rule": rule,
+                     "rows_in": int(rows_in), "rows_out": int(rows_out)})
+
+    def _write(self, record):
+        if self.jsonl_path is None:
+            return
+        record["time"] = time.time()
+        with self._lock, open(self.jsonl_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{PREFIX}_{name} {value}")
+
+        with self._lock:
+            timers = [(((("stage", stage),) + labels), values) for (stage, labels), values in self.timers.items()]
+            rules = [((("file", file_name), ("rule", rule)), values) for (file_name, rule), values in self.rules.items()]
+
+        family("stage_calls_total", "counter", "Number of runs of a pipeline stage",
+               [(labels, v[0]) for labels, v in timers])
+        family("stage_seconds_total", "counter", "Total wall time of a pipeline stage",
+               [(labels, f"{v[1]:.6f}") for labels, v in timers])
+        family("stage_seconds_max", "gauge", "Longest single run of a pipeline stage",
+               [(labels, f"{v[2]:.6f}") for labels, v in timers])
+        if self.trace_memory:
+            family("stage_peak_traced_bytes", "gauge", "Peak tracemalloc memory during a stage",
+                   [(labels, v[3]) for labels, v in timers])
+        family("rule_rows_in_total", "counter", "Rows before a cleaning rule",
+               [(labels, v[0]) for labels, v in rules])
+        family("rule_rows_out_total", "counter", "Rows after a cleaning rule",
+               [(labels, v[1]) for labels, v in rules])
+        family("rule_rows_dropped_total", "counter", "Rows removed or coerced by a cleaning rule",
+               [(labels, v[0] - v[1]) for labels, v in rules])
+        rss = peak_rss_mb()
+        if rss is not None:
+            family("peak_rss_bytes", "gauge", "Peak resident memory of the process",
+                   [((), int(rss * 2**20))])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9108, host="127.0.0.1"):
+        """Serves /metrics from a daemon thread; returns the server (call .shutdown() to stop it)"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# process-wide instance used by all modules
+METRICS = Metrics()
+
+
+def timed(stage):
+    """Decorator: times every call of the function as 'stage' while METRICS is enabled"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return func(*args, **kwargs)
+            with METRICS.timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
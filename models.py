@@ -1,13 +1,25 @@
 from datetime import datetime
 from abc import ABC, abstractmethod
 
+import numpy as np
+
 class Entity(ABC):
     """Abstract base class for all system entities.
-        Ensures that every object has a unique ID and a creation timestamp."""   
+        Ensures that every object has a unique ID and a creation timestamp.
+        All classes use __slots__ (no per-instance __dict__); the timestamp is
+        only taken when created_at is read for the first time."""   
+
+    __slots__ = ("id", "_created_at")
      
     def __init__(self, entity_id: int):
         self.id = entity_id
-        self.created_at = datetime.now()
+        self._created_at = None
+
+    @property
+    def created_at(self):
+        if self._created_at is None:
+            self._created_at = datetime.now()
+        return self._created_at
     
     @abstractmethod
     def __str__(self):
@@ -22,6 +34,8 @@ class Bike(Entity):
 
     status = ("available", "in_use", "maintenance")
 
+    __slots__ = ("bike_type",)
+
     def __init__(self, bike_id: int, bike_type: str):
         super().__init__(bike_id)
         self.bike_type = bike_type
@@ -35,6 +49,8 @@ class Bike(Entity):
 class ClassicBike(Bike):
     """A standard bicycle with mechanical gears."""
 
+    __slots__ = ("gear_count",)
+
     def __init__(self, bike_id, bike_type, gear_count: int):
         super().__init__(bike_id, bike_type)
         self.gear_count = gear_count
@@ -45,6 +61,8 @@ class ClassicBike(Bike):
 class ElectricBike(Bike):
     """An electric bicycle with an integrated battery and power assistance."""
 
+    __slots__ = ("battery_level", "max_range_km")
+
     def __init__(self, bike_id, bike_type, battery_level: int, max_range_km: float):
         super().__init__(bike_id, bike_type)
         self.battery_level = battery_level
@@ -56,6 +74,8 @@ class ElectricBike(Bike):
 class Station(Entity):
     """A physical location where users can pick up or return bikes."""
 
+    __slots__ = ("station_id", "name", "capacity", "latitude", "longitude")
+
     def __init__(self, entity_id: int, name: str, capacity: int, latitude: float, longitude: float):
         super().__init__(entity_id)
         self.station_id = entity_id
@@ -73,6 +93,8 @@ class Station(Entity):
 class User(Entity):
     """Base class for all system users."""
 
+    __slots__ = ("user_id", "name", "email", "user_type")
+
     def __init__(self, entity_id: int, name: str, email: str, user_type: str):
         super().__init__(entity_id)
         self.user_id = entity_id
@@ -89,6 +111,8 @@ class User(Entity):
 class CasualUser(User):
     """A user without a long-term subscription, typically using day passes."""
 
+    __slots__ = ("day_pass_count",)
+
     def __init__(self, entity_id, name, email, user_type, day_pass_count: int):
         super().__init__(entity_id, name, email, user_type)
         self.day_pass_count = day_pass_count
@@ -102,7 +126,10 @@ class CasualUser(User):
 class MemberUser(User):
     """A registered user with an active subscription plan (Basic or Premium)."""
 
-    tier = ("basic", "premium")
+    # possible values of the tier attribute
+    TIERS = ("basic", "premium")
+
+    __slots__ = ("membership_start", "membership_end", "tier")
     
     def __init__(
             self, 
@@ -127,6 +154,8 @@ class MemberUser(User):
 class Trip(Entity):
     """Record of a single bike rental, connecting a user, a bike, and two stations."""
 
+    __slots__ = ("trip_id", "user", "bike", "start_station", "end_station", "start_time", "end_time", "distance_km")
+
     def __init__(
             self, 
             entity_id: int, 
@@ -156,6 +185,8 @@ class Trip(Entity):
 class MaintenanceRecord(Entity):
     """Log of maintenance, repairs, or diagnostics performed on a specific bike."""
 
+    __slots__ = ("record_id", "bike", "date", "maintenance_type", "cost", "description")
+
     def __init__(
             self,
             entity_id: int,
@@ -184,6 +215,8 @@ class MaintenanceRecord(Entity):
 class BikeShareSystem(Entity):
     """The main system orchestrator that manages data processing and operations."""
 
+    __slots__ = ()
+
     def __init__(self, entity_id: int):
         super().__init__(entity_id)
 
@@ -192,3 +225,182 @@ class BikeShareSystem(Entity):
 
     def __repr__(self):
         return "BikeShareSystem()"
+
+
+class RowView:
+    """Lightweight view of one row of a column table (no data is copied)."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row: int):
+        self._table = table
+        self._row = row
+
+    def __getattr__(self, name):
+        # only called for names that are not slots, i.e. the fields of the table.
+        # Private and dunder names are never fields: copy/pickle look them up on an instance
+        # whose _table slot is not set yet, and self._table would recurse.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._table.value(name, self._row)
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={self._table.value(f, self._row)!r}" for f in self._table.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+class BikeView(RowView):
+    """Row of a FleetTable, behaves like a read-only Bike."""
+
+    __slots__ = ()
+
+    @property
+    def id(self):
+        return self.bike_id
+
+    def __str__(self):
+        return f"Bike {self.bike_id} ({self.bike_type})"
+
+    def to_object(self):
+        """Full ClassicBike / ElectricBike object for this row"""
+        if self.bike_type == "electric":
+            return ElectricBike(self.bike_id, self.bike_type, self.battery_level, self.max_range_km)
+        return ClassicBike(self.bike_id, self.bike_type, self.gear_count)
+
+
+class TripView(RowView):
+    """Row of a TripTable, behaves like a read-only Trip with IDs instead of object references."""
+
+    __slots__ = ()
+
+    @property
+    def id(self):
+        return self.trip_id
+
+    @property
+    def bike(self):
+        """Bike of the trip, looked up in the FleetTable attached to the trip table"""
+        fleet = self._table.fleet
+        return fleet.get(self.bike_id) if fleet is not None else None
+
+    def __str__(self):
+        return f"Trip {self.trip_id}: Bike {self.bike_id} from {self.start_station_id} to {self.end_station_id}"
+
+
+class ColumnTable:
+    """
+    Columnar collection of entities: one NumPy array per field instead of one object per row.
+    Categorical text (e.g. bike_type) is stored as small integer codes plus the list of categories.
+    Indexing with an int returns a row view, with a slice / mask / index array a new table.
+    """
+
+    FIELDS = ()
+    OPTIONAL_FIELDS = ()
+    view_class = RowView
+
+    def __init__(self, columns: dict, categories: dict = None):
+        self.columns = {name: np.asarray(values) for name, values in columns.items()}
+        self.categories = categories or {}
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"All columns of a {type(self).__name__} need the same length")
+        self._length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """Builds the table from a DataFrame, missing optional fields are filled with NaN"""
+        columns, categories = {}, {}
+        for name in cls.FIELDS:
+            if name not in df.columns:
+                if name not in cls.OPTIONAL_FIELDS:
+                    raise KeyError(f"Column '{name}' is required for a {cls.__name__}")
+                columns[name] = np.full(len(df), np.nan)
+                continue
+            values = df[name]
+            if hasattr(values, "cat"):
+                columns[name] = values.cat.codes.to_numpy()
+                categories[name] = np.asarray(values.cat.categories, dtype=object)
+            else:
+                columns[name] = values.to_numpy()
+        return cls(columns, categories, **kwargs)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for row in range(self._length):
+            yield self.view_class(self, row)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self._length
+            if not 0 <= key < self._length:
+                raise IndexError(key)
+            return self.view_class(self, int(key))
+        return self._subset({name: values[key] for name, values in self.columns.items()})
+
+    def _subset(self, columns):
+        return type(self)(columns, self.categories)
+
+    def column(self, name):
+        """Decoded values of one field as a NumPy array"""
+        values = self.columns[name]
+        if name in self.categories:
+            return self.categories[name][values]
+        return values
+
+    def value(self, name, row):
+        value = self.columns[name][row]
+        if name in self.categories:
+            return self.categories[name][value] if value >= 0 else None
+        return value.item() if hasattr(value, "item") and not isinstance(value, np.datetime64) else value
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values())
+
+
+class FleetTable(ColumnTable):
+    """All bikes of the fleet in NumPy arrays, rows are BikeView objects."""
+
+    FIELDS = ("bike_id", "bike_type", "battery_level", "max_range_km", "gear_count")
+    OPTIONAL_FIELDS = ("battery_level", "max_range_km", "gear_count")
+    view_class = BikeView
+
+    def __init__(self, columns: dict, categories: dict = None):
+        super().__init__(columns, categories)
+        # sorted ID index for get()
+        self._order = np.argsort(self.columns["bike_id"], kind="stable")
+        self._sorted_ids = self.columns["bike_id"][self._order]
+
+    @classmethod
+    def from_trips(cls, trips_df):
+        """One row per bike_id with the bike_type of its last trip"""
+        last = trips_df.drop_duplicates("bike_id", keep="last")
+        return cls.from_frame(last[["bike_id", "bike_type"]])
+
+    def get(self, bike_id):
+        """BikeView for an ID (binary search) or None"""
+        pos = np.searchsorted(self._sorted_ids, bike_id)
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == bike_id:
+            return self.view_class(self, int(self._order[pos]))
+        return None
+
+
+class TripTable(ColumnTable):
+    """All trips in NumPy arrays, rows are TripView objects; bikes resolve through an optional FleetTable."""
+
+    FIELDS = ("trip_id", "user_id", "bike_id", "start_station_id", "end_station_id",
+              "start_time", "end_time", "distance_km")
+    view_class = TripView
+
+    def __init__(self, columns: dict, categories: dict = None, fleet: FleetTable = None):
+        super().__init__(columns, categories)
+        self.fleet = fleet
+
+    def _subset(self, columns):
+        return type(self)(columns, self.categories, self.fleet)
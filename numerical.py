@@ -1,5 +1,10 @@
 import numpy as np
 
+from metrics import timed
+
+# mean Earth radius used by the haversine formula
+EARTH_RADIUS_KM = 6371.0088
+
 class NumericalProcessor:
     """
     Handles mathematical and statistical computations using NumPy.
@@ -26,6 +31,47 @@ class NumericalProcessor:
         return distance
 
     @staticmethod
+    def haversine_distance(lat1, lon1, lat2, lon2):
+        """
+        Great-circle distance in km between points given in degrees.
+        Works element-wise on scalars or NumPy arrays (with broadcasting).
+        """
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    @staticmethod
+    @timed("station_distance_matrix")
+    def station_distance_matrix(latitudes, longitudes, dtype=np.float32):
+        """
+        Haversine distance between every pair of stations, computed once with broadcasting.
+
+        Args:
+            latitudes, longitudes: Coordinates of the stations (in station code order).
+            dtype: Type of the matrix, float32 keeps 5000 stations at ~100 MB.
+
+        Returns:
+            numpy.ndarray: (stations x stations) matrix of distances in km.
+        """
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        return NumericalProcessor.haversine_distance(
+            lat[:, None], lon[:, None], lat[None, :], lon[None, :]).astype(dtype)
+
+    @staticmethod
+    def implied_distances(distance_matrix, start_codes, end_codes):
+        """
+        Station-to-station distance for every trip with a single fancy-indexing gather.
+        Codes are the row numbers of the matrix, -1 (unknown station) gives NaN.
+        """
+        start_codes = np.asarray(start_codes)
+        end_codes = np.asarray(end_codes)
+        distances = distance_matrix[start_codes, end_codes].astype(np.float64)
+        distances[(start_codes < 0) | (end_codes < 0)] = np.nan
+        return distances
+
+    @staticmethod
+    @timed("calculate_descriptive_stats")
     def calculate_descriptive_stats(data_series):
         """
         Computes basic statistics for a given data series using NumPy.
@@ -36,8 +82,8 @@ class NumericalProcessor:
         Returns:
             dict: Dictionary containing mean, median, and standard deviation.
         """
-        # Ensure we are working with a numpy array
-        arr = np.array(data_series)
+        # Ensure we are working with a numpy array (without copying an existing one)
+        arr = np.asarray(data_series)
         
         # Calculate stats
         stats = {
@@ -49,6 +95,131 @@ class NumericalProcessor:
         }
         return stats
 
+    @staticmethod
+    @timed("summarize_chunks")
+    def summarize_chunks(chunks, columns, compression=200):
+        """
+        Descriptive stats of some columns without loading the whole file,
+        e.g. summarize_chunks(pandas.read_csv("trips.csv", chunksize=100_000), ["duration_minutes", "distance_km"]).
+
+        Args:
+            chunks: Iterable of DataFrames (a read_csv chunk reader, BikeShare.iter_clean_chunks, ...).
+            columns: Names of the numeric columns to summarise.
+
+        Returns:
+            dict: {column: StreamingStats}
+        """
+        accumulators = {col: StreamingStats(compression) for col in columns}
+        for chunk in chunks:
+            for col, acc in accumulators.items():
+                acc.update(chunk[col])
+        return accumulators
+
+
+class StreamingStats:
+    """
+    Descriptive statistics that are fed chunk by chunk and can be merged across workers.
+    - count, mean and variance with the Welford/Chan update (numerically stable)
+    - exact min and max
+    - median and percentiles from a merging t-digest (a few hundred centroids,
+      error is smallest near the tails)
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        # t-digest centroids, sorted by mean
+        self.centroids = np.empty(0)
+        self.weights = np.empty(0)
+
+    def update(self, values):
+        """Adds a chunk of values (list, array or Series), NaN values are skipped"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return self
+
+        chunk = StreamingStats(self.compression)
+        chunk.count = values.size
+        chunk.mean = values.mean()
+        chunk.m2 = np.square(values - chunk.mean).sum()
+        chunk.min = values.min()
+        chunk.max = values.max()
+        chunk.centroids = values
+        chunk.weights = np.ones(values.size)
+        return self.merge(chunk, inplace=True)
+
+    def merge(self, other, inplace=False):
+        """Combines two accumulators (Chan et al. parallel variance + t-digest merge)"""
+        result = self if inplace else StreamingStats(self.compression)
+        n = self.count + other.count
+        if n == 0:
+            return result
+
+        delta = other.mean - self.mean
+        result.mean = self.mean + delta * other.count / n
+        result.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / n
+        result.count = n
+        result.min = min(self.min, other.min)
+        result.max = max(self.max, other.max)
+        result.centroids, result.weights = self._compress(
+            np.concatenate([self.centroids, other.centroids]),
+            np.concatenate([self.weights, other.weights]))
+        return result
+
+    def _compress(self, means, weights):
+        """
+        Merging t-digest step: sorts the centroids and merges neighbours whose
+        cumulative quantile falls into the same unit of the k1 scale function,
+        k(q) = compression / (2 pi) * arcsin(2q - 1). Done with one reduceat, no Python loop.
+        """
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+
+        total = weights.sum()
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_mid - 1)
+        groups = np.floor(k - k[0]).astype(np.int64)
+
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        merged_weights = np.add.reduceat(weights, starts)
+        merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+        return merged_means, merged_weights
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else np.nan
+
+    def quantile(self, q):
+        """Approximate quantile(s) for q in [0, 1]"""
+        if not self.count:
+            return np.nan
+        cum_mid = np.cumsum(self.weights) - self.weights / 2
+        # the exact min/max are the end points of the interpolation
+        xs = np.r_[0.0, cum_mid, self.count]
+        ys = np.r_[self.min, self.centroids, self.max]
+        return np.interp(np.asarray(q) * self.count, xs, ys)
+
+    def result(self, percentiles=(25, 75, 95)):
+        """Same keys as NumericalProcessor.calculate_descriptive_stats plus count and percentiles"""
+        stats = {
+            "mean": self.mean if self.count else np.nan,
+            "median": float(self.quantile(0.5)),
+            "std_dev": np.sqrt(self.variance),
+            "max": self.max if self.count else np.nan,
+            "min": self.min if self.count else np.nan,
+            "count": self.count,
+        }
+        for p in percentiles:
+            stats[f"p{p}"] = float(self.quantile(p / 100))
+        return stats
+
+
 # Example of how this might be used (can be removed later)
 if __name__ == "__main__":
     proc = NumericalProcessor()
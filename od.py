@@ -0,0 +1,173 @@
+"""
+Origin-destination (OD) matrix.
+Trip counts, total distance and total duration for every (start station, end station) pair are
+dense NumPy arrays indexed by station code, built with one bincount pass per measure.
+Optional slice dimensions (hour, weekday, user_type) are extra leading axes, so
+"top routes per station at 8 am" is an array reduction plus argpartition, not a groupby.
+Counts are stored as int32 and the sums as float32 (half the memory of a stations² x slices
+cube); reductions accumulate in int64 / float64.
+"""
+
+import numpy
+import pandas
+
+from schema import format_ids
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def _hours_and_weekdays(start_times):
+    values = start_times.to_numpy(dtype='datetime64[ns]')
+    valid = ~numpy.isnat(values)
+    days = values.astype('datetime64[D]')
+    hours = ((values - days).astype('timedelta64[h]').astype(numpy.int64))
+    # 1970-01-01 was a Thursday (weekday 3)
+    weekdays = (days.astype(numpy.int64) + 3) % 7
+    return numpy.where(valid, hours, -1), numpy.where(valid, weekdays, -1)
+
+
+class ODMatrix:
+    """
+    counts / distance / duration arrays of shape (*dimension sizes, stations, stations).
+    'dimensions' is a tuple of slice names out of 'hour', 'weekday', 'user_type' and
+    'labels' holds the values along every dimension (user types without trips, e.g. the
+    'Unknown' category, get no slice).
+    Trips with an unknown station or a missing slice value are not counted.
+    Without a duration_minutes column the duration is end_time - start_time.
+    """
+
+    def __init__(self, registry, dimensions, labels, counts, distance, duration):
+        self.registry = registry
+        self.dimensions = tuple(dimensions)
+        self.labels = labels
+        self.counts = counts
+        self.distance = distance
+        self.duration = duration
+        # rank of every station code by station_id, for deterministic tie order
+        self._id_rank = numpy.argsort(numpy.argsort(registry.index.to_numpy(), kind='stable'), kind='stable')
+
+    @classmethod
+    def from_trips(cls, trips, registry, by=()):
+        if isinstance(by, str):
+            by = (by,)
+        n = len(registry)
+        start = registry.codes(trips['start_station_id'])
+        end = registry.codes(trips['end_station_id'])
+        valid = (start >= 0) & (end >= 0)
+        key = start.astype(numpy.int64) * n + end
+
+        # every slice dimension becomes a leading axis of the flat key
+        shape, labels = [], {}
+        hours = weekdays = None
+        size = n * n
+        for dim in reversed(by):
+            if dim in ('hour', 'weekday'):
+                if hours is None:
+                    hours, weekdays = _hours_and_weekdays(trips['start_time'])
+                values, dim_labels = (hours, list(range(24))) if dim == 'hour' else (weekdays, list(WEEKDAYS))
+            elif dim == 'user_type':
+                user_types = trips['user_type'].astype('category').cat.remove_unused_categories()
+                values = user_types.cat.codes.to_numpy().astype(numpy.int64)
+                dim_labels = [str(c) for c in user_types.cat.categories]
+            else:
+                raise ValueError(f"Unknown OD dimension: {dim}")
+            valid &= values >= 0
+            key = key + numpy.where(values >= 0, values, 0) * size
+            size *= len(dim_labels)
+            shape.insert(0, len(dim_labels))
+            labels[dim] = dim_labels
+        shape += [n, n]
+
+        key = key[valid]
+        distance = trips['distance_km'].to_numpy(dtype=numpy.float64)[valid]
+        if 'duration_minutes' in trips.columns:
+            duration = trips['duration_minutes'].to_numpy(dtype=numpy.float64)
+        else:
+            duration = (trips['end_time'] - trips['start_time']).dt.total_seconds().to_numpy(dtype=numpy.float64) / 60
+        duration = duration[valid]
+        counts = numpy.bincount(key, minlength=size)
+        # int32 unless a single cell has more trips than int32 can count
+        counts = counts.astype(numpy.int32 if counts.max(initial=0) <= numpy.iinfo(numpy.int32).max else numpy.int64)
+        distance_sum = numpy.bincount(key, weights=numpy.nan_to_num(distance), minlength=size).astype(numpy.float32)
+        duration_sum = numpy.bincount(key, weights=numpy.nan_to_num(duration), minlength=size).astype(numpy.float32)
+        return cls(registry, by, labels, counts.reshape(shape), distance_sum.reshape(shape), duration_sum.reshape(shape))
+
+    def _select(self, array, where):
+        """Sums 'array' over all slice axes, keeping only the slice values in 'where'"""
+        where = where or {}
+        unknown = set(where) - set(self.dimensions)
+        if unknown:
+            raise ValueError(f"Not a dimension of this matrix: {sorted(unknown)} (dimensions: {self.dimensions})")
+        # int32 counts / float32 sums are added up in 64 bits
+        total = numpy.int64 if array.dtype.kind in 'iu' else numpy.float64
+        for dim in self.dimensions:
+            # the current first axis is always the next slice dimension
+            if dim in where:
+                wanted = where[dim]
+                wanted = [wanted] if isinstance(wanted, (int, str)) else list(wanted)
+                positions = [self.labels[dim].index(value) for value in wanted]
+                array = array[positions].sum(axis=0, dtype=total)
+            else:
+                array = array.sum(axis=0, dtype=total)
+        return array.astype(total, copy=False)
+
+    def matrix(self, measure='counts', where=None):
+        """(stations x stations) matrix of one measure, e.g. matrix(where={'hour': [7, 8, 9]})"""
+        return self._select(getattr(self, measure), where)
+
+    def top_routes(self, k=10, where=None):
+        """
+        The k most frequent routes (start -> end) as a DataFrame, found with argpartition.
+        Equal counts are ordered by (start_station_id, end_station_id).
+        """
+        counts = self.matrix('counts', where)
+        n = counts.shape[0]
+        pair_rank = (self._id_rank[:, None] * n + self._id_rank[None, :]).ravel()
+        # unique sort key: count first, then the lower station IDs
+        keys = counts.ravel().astype(numpy.int64) * (n * n) + (n * n - 1 - pair_rank)
+        k = min(k, int((counts > 0).sum()))
+        if k <= 0:
+            return self._routes_frame(counts, numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64), where)
+        top = numpy.argpartition(-keys, k - 1)[:k]
+        top = top[numpy.argsort(-keys[top])]
+        return self._routes_frame(counts, top // n, top % n, where)
+
+    def top_per_station(self, k=50, where=None):
+        """
+        The k most frequent destinations of every start station (argpartition along each row),
+        e.g. top_per_station(50, where={'hour': 8}). Routes without trips are left out.
+        """
+        counts = self.matrix('counts', where)
+        n = counts.shape[0]
+        k = min(k, n)
+        if not n or k <= 0:
+            return self._routes_frame(counts, numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64), where)
+        keys = counts.astype(numpy.int64) * n + (n - 1 - self._id_rank[None, :])
+        top = numpy.argpartition(-keys, k - 1, axis=1)[:, :k]
+        top = numpy.take_along_axis(top, numpy.argsort(-numpy.take_along_axis(keys, top, axis=1), axis=1), axis=1)
+
+        # rows of start stations in station_id order
+        starts = numpy.repeat(numpy.argsort(self._id_rank), k)
+        ends = top[numpy.argsort(self._id_rank)].ravel()
+        keep = counts[starts, ends] > 0
+        return self._routes_frame(counts, starts[keep], ends[keep], where)
+
+    def _routes_frame(self, counts, starts, ends, where):
+        """
+        Routes frame of the (start, end) code pairs. 'counts' is the already reduced count matrix
+        of the caller; distance and duration are reduced only at the selected cells.
+        """
+        counts = counts[starts, ends]
+        distance = self._select(self.distance[..., starts, ends], where)
+        duration = self._select(self.duration[..., starts, ends], where)
+        index = self.registry.index
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return pandas.DataFrame({
+                'start_station_id': format_ids(index[starts], 'station_id'),
+                'end_station_id': format_ids(index[ends], 'station_id'),
+                'start_name': self.registry.names.to_numpy()[starts],
+                'end_name': self.registry.names.to_numpy()[ends],
+                'count': counts,
+                'avg_distance_km': distance / counts,
+                'avg_duration_min': duration / counts,
+            })
@@ -0,0 +1,171 @@
+"""
+Pricing engine.
+Fares of whole trips frames are computed in one vectorised pass: plans are resolved once per
+category of user_type (not per row), every tariff parameter is a small lookup array indexed by
+plan code or hour. Several tariffs are priced together by broadcasting over a tariff axis.
+"""
+
+import numpy
+import pandas
+
+from models import MemberUser
+
+# plan codes: casual riders + the member tiers
+PLANS = ("casual",) + MemberUser.TIERS
+CASUAL, BASIC, PREMIUM = range(len(PLANS))
+# code of trips whose user_type is neither casual nor member (e.g. 'Unknown'): they have no
+# plan, cost nothing and are only counted (index len(PLANS) of the per-plan arrays)
+UNPRICED = len(PLANS)
+
+
+class Tariff:
+    """
+    One fare proposal. A trip costs
+        unlock_fee[plan] + billable_minutes * (per_minute[plan] + electric surcharge) * hour multiplier
+    with billable_minutes = whole minutes above included_minutes[plan].
+    Per-plan values are dicts {plan: value}, hour_multipliers is {start hour: factor}.
+    """
+
+    def __init__(self, name, unlock_fee, per_minute, included_minutes=None,
+                 electric_per_minute=0.0, hour_multipliers=None):
+        self.name = name
+        self.unlock_fee = self._per_plan(unlock_fee)
+        self.per_minute = self._per_plan(per_minute)
+        self.included_minutes = self._per_plan(included_minutes or {})
+        self.electric_per_minute = float(electric_per_minute)
+        self.hour_factors = numpy.ones(24)
+        for hour, factor in (hour_multipliers or {}).items():
+            self.hour_factors[hour] = factor
+
+    @staticmethod
+    def _per_plan(values):
+        unknown = set(values) - set(PLANS)
+        if unknown:
+            raise ValueError(f"Unknown plans {sorted(unknown)}, expected {PLANS}")
+        return numpy.array([values.get(plan, 0.0) for plan in PLANS], dtype=numpy.float64)
+
+    def __repr__(self):
+        return f"Tariff('{self.name}')"
+
+
+PEAK_HOURS = {hour: 1.25 for hour in (7, 8, 9, 16, 17, 18)}
+
+DEFAULT_TARIFF = Tariff(
+    "standard",
+    unlock_fee={"casual": 1.00, "basic": 0.0, "premium": 0.0},
+    per_minute={"casual": 0.25, "basic": 0.15, "premium": 0.10},
+    included_minutes={"basic": 30, "premium": 45},
+    electric_per_minute=0.10,
+    hour_multipliers=PEAK_HOURS,
+)
+
+
+class PricingEngine:
+    """
+    Prices trips frames (columns user_type, bike_type, start_time and duration_minutes
+    or end_time). Members are billed with their tier from 'tiers' (Series or dict
+    user_id -> 'basic'/'premium'); members without a known tier pay 'basic'.
+    Trips with another or a missing user_type are UNPRICED (fare 0, counted separately).
+    """
+
+    def __init__(self, tiers=None):
+        if tiers is not None and not isinstance(tiers, pandas.Series):
+            tiers = pandas.Series(tiers)
+        self.tiers = tiers
+
+    def plan_codes(self, trips):
+        """Plan code of every trip (CASUAL / BASIC / PREMIUM, UNPRICED for unknown user types)"""
+        user_types = trips['user_type']
+        if not isinstance(user_types.dtype, pandas.CategoricalDtype):
+            user_types = user_types.astype('category')
+        # one lookup per category, the rows only index the small table (code -1 = missing)
+        known = {"casual": CASUAL, "member": BASIC}
+        lookup = numpy.array([known.get(category, UNPRICED) for category in user_types.cat.categories]
+                             + [UNPRICED], dtype=numpy.int8)
+        plans = lookup[user_types.cat.codes.to_numpy()]
+
+        if self.tiers is not None and len(self.tiers):
+            tier_codes = pandas.Index(self.tiers.index).get_indexer(trips['user_id'])
+            tier_plans = numpy.where(self.tiers.to_numpy() == "premium", PREMIUM, BASIC).astype(numpy.int8)
+            members = (plans == BASIC) & (tier_codes >= 0)
+            plans[members] = tier_plans[tier_codes[members]]
+        return plans
+
+    @staticmethod
+    def trip_minutes(trips):
+        if 'duration_minutes' in trips.columns:
+            minutes = trips['duration_minutes'].to_numpy(dtype=numpy.float64)
+        else:
+            minutes = (trips['end_time'] - trips['start_time']).dt.total_seconds().to_numpy() / 60
+        # every started minute is billed, missing durations cost only the unlock fee
+        return numpy.ceil(numpy.nan_to_num(numpy.clip(minutes, 0, None)))
+
+    def trip_features(self, trips):
+        """(plans, hours, electric, minutes) arrays: everything a tariff needs to price the trips"""
+        start = trips['start_time'].to_numpy(dtype='datetime64[ns]')
+        hours = numpy.zeros(len(trips), dtype=numpy.int64)
+        valid = ~numpy.isnat(start)
+        hours[valid] = (start[valid] - start[valid].astype('datetime64[D]')).astype('timedelta64[h]').astype(numpy.int64)
+        electric = (trips['bike_type'] == 'electric').to_numpy()
+        return self.plan_codes(trips), hours, electric, self.trip_minutes(trips)
+
+    @staticmethod
+    def _fares(features, tariffs):
+        """Fare matrix (tariffs x trips) by broadcasting the stacked tariff arrays (UNPRICED trips cost 0)"""
+        plans, hours, electric, minutes = features
+        priced = plans != UNPRICED
+        plans = numpy.where(priced, plans, CASUAL)
+        unlock = numpy.stack([t.unlock_fee for t in tariffs])[:, plans]
+        rate = numpy.stack([t.per_minute for t in tariffs])[:, plans]
+        included = numpy.stack([t.included_minutes for t in tariffs])[:, plans]
+        surcharge = numpy.array([t.electric_per_minute for t in tariffs])[:, None] * electric
+        factor = numpy.stack([t.hour_factors for t in tariffs])[:, hours]
+        billable = numpy.maximum(minutes - included, 0)
+        return (unlock + billable * (rate + surcharge) * factor) * priced
+
+    def fares(self, trips, tariff=DEFAULT_TARIFF):
+        """Fare of every trip under one tariff (array in row order)"""
+        return self._fares(self.trip_features(trips), [tariff])[0]
+
+    def compare(self, trips, tariffs, chunk_size=1_000_000):
+        """
+        What-if repricing: revenue of the trips under every tariff, computed together.
+        The trips are processed in chunks, so the fare matrix never holds more than
+        len(tariffs) x chunk_size values.
+        Returns a DataFrame indexed by tariff name: revenue per plan, total and average fare
+        of the priced trips and the number of UNPRICED trips.
+        """
+        features = self.trip_features(trips)
+        revenue = numpy.zeros((len(tariffs), len(PLANS)))
+        for start in range(0, len(trips), chunk_size):
+            chunk = tuple(values[start:start + chunk_size] for values in features)
+            fares = self._fares(chunk, tariffs)
+            for row, tariff_fares in enumerate(fares):
+                revenue[row] += numpy.bincount(chunk[0], weights=tariff_fares, minlength=UNPRICED + 1)[:UNPRICED]
+
+        unpriced = int((features[0] == UNPRICED).sum())
+        priced = len(trips) - unpriced
+        result = pandas.DataFrame(revenue, index=[t.name for t in tariffs], columns=list(PLANS))
+        result.index.name = 'tariff'
+        result['total'] = revenue.sum(axis=1)
+        result['avg_fare'] = result['total'] / priced if priced else numpy.nan
+        result['unpriced_trips'] = unpriced
+        return result
+
+    def plan_revenue(self, trips, tariff=DEFAULT_TARIFF):
+        """
+        (revenue, trips) arrays indexed by plan code under one tariff; the last entry
+        (index UNPRICED) counts the trips of unknown user types, their revenue is 0
+        """
+        features = self.trip_features(trips)
+        fares = self._fares(features, [tariff])[0]
+        return (numpy.bincount(features[0], weights=fares, minlength=UNPRICED + 1),
+                numpy.bincount(features[0], minlength=UNPRICED + 1).astype(numpy.int64))
+
+    def revenue_by_plan(self, trips, tariff=DEFAULT_TARIFF):
+        """
+        {plan: revenue} of the trips under one tariff, plans without trips are left out
+        (UNPRICED trips are not a plan, see plan_revenue)
+        """
+        revenue, counts = self.plan_revenue(trips, tariff)
+        return {plan: float(revenue[code]) for code, plan in enumerate(PLANS) if counts[code]}
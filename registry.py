@@ -0,0 +1,70 @@
+"""
+Station registry: ID -> row index of the stations table, built once at load time.
+Replaces boolean-mask scans over the stations frame for every single ID.
+"""
+
+import numpy
+import pandas
+
+from numerical import NumericalProcessor
+from schema import format_ids
+
+
+class StationRegistry:
+    """
+    Index of the stations table by station_id.
+    Names and row positions for many IDs at once are resolved with vectorised lookups.
+    """
+
+    def __init__(self, stations_df):
+        self.stations = stations_df
+        # like the old mask lookup: for duplicate IDs the first row wins
+        first_rows = ~stations_df['station_id'].duplicated(keep='first').to_numpy()
+        self.index = pandas.Index(stations_df['station_id'].to_numpy()[first_rows])
+        self.rows = numpy.flatnonzero(first_rows)
+        self.names = pandas.Series(stations_df['station_name'].to_numpy()[first_rows], index=self.index)
+        self._distance_matrix = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def codes(self, station_ids):
+        """Station code (0..len-1) for every ID, -1 for unknown IDs"""
+        return self.index.get_indexer(station_ids)
+
+    def row(self, station_id):
+        """Row of the stations table for one ID or None"""
+        code = self.index.get_indexer([station_id])[0]
+        return None if code < 0 else self.stations.iloc[self.rows[code]]
+
+    def name(self, station_id):
+        """Name of a single station, 'Station <ID>' if it is unknown"""
+        return self.names_for([station_id])[0]
+
+    def names_for(self, station_ids):
+        """Names for a list / Series of IDs in one vectorised map"""
+        ids = pandas.Series(station_ids)
+        names = ids.map(self.names)
+        missing = names.isna()
+        if missing.any():
+            fallback = [f"Station {sid}" for sid in format_ids(ids[missing], 'station_id')]
+            names = names.astype(object)
+            names[missing] = fallback
+        return names.tolist()
+
+    def distance_matrix(self):
+        """Haversine distance (km) between all stations, indexed by station code, computed on first use"""
+        if self._distance_matrix is None:
+            rows = self.stations.iloc[self.rows]
+            self._distance_matrix = NumericalProcessor.station_distance_matrix(
+                rows['latitude'].to_numpy(), rows['longitude'].to_numpy())
+        return self._distance_matrix
+
+    def implied_distances(self, start_ids, end_ids):
+        """Great-circle distance between start and end station for every trip, NaN for unknown stations"""
+        return NumericalProcessor.implied_distances(
+            self.distance_matrix(), self.codes(start_ids), self.codes(end_ids))
+
+    def label_counts(self, counts):
+        """{station name: count} for a Series of counts indexed by station ID"""
+        return dict(zip(self.names_for(counts.index), counts.tolist()))
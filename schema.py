@@ -0,0 +1,180 @@
+"""
+Explicit column types for every source file.
+Low-cardinality text becomes categorical, prefixed IDs (TR10000, USR1014, BK243, ST105, MR5000)
+become int32 numbers and datetimes are parsed with a fixed format.
+"""
+
+from pathlib import Path
+
+import numpy
+import pandas
+
+# value used for IDs that are missing or do not have the expected prefix
+UNKNOWN_ID = -1
+UNKNOWN_LABEL = 'Unknown'
+INT32_MAX = numpy.iinfo(numpy.int32).max
+
+ID_PREFIXES = {
+    'trip_id': 'TR',
+    'user_id': 'USR',
+    'bike_id': 'BK',
+    'station_id': 'ST',
+    'start_station_id': 'ST',
+    'end_station_id': 'ST',
+    'record_id': 'MR',
+}
+
+USER_TYPES = ['casual', 'member']
+BIKE_TYPES = ['classic', 'electric']
+
+SCHEMAS = {
+    'stations.csv': {
+        'ids': ['station_id'],
+        'categories': {},
+        'datetimes': {},
+    },
+    'trips.csv': {
+        'ids': ['trip_id', 'user_id', 'bike_id', 'start_station_id', 'end_station_id'],
+        'categories': {
+            'user_type': USER_TYPES,
+            'bike_type': BIKE_TYPES,
+            'status': ['completed', 'cancelled'],
+        },
+        'datetimes': {
+            'start_time': '%Y-%m-%d %H:%M:%S',
+            'end_time': '%Y-%m-%d %H:%M:%S',
+        },
+    },
+    'maintenance.csv': {
+        'ids': ['record_id', 'bike_id'],
+        'categories': {
+            'bike_type': BIKE_TYPES,
+            'maintenance_type': [
+                'tire_repair', 'brake_adjustment', 'battery_replacement',
+                'chain_lubrication', 'general_inspection',
+            ],
+        },
+        'datetimes': {
+            'date': '%Y-%m-%d',
+        },
+    },
+}
+
+
+def get_schema(file_name):
+    """
+    Returns the schema of a source file or None for files without one.
+    Batch files like trips_2024-06-01.csv use the schema of trips.csv.
+    """
+    name = Path(file_name).name
+    if name in SCHEMAS:
+        return SCHEMAS[name]
+    for schema_name, schema in SCHEMAS.items():
+        if name.startswith(Path(schema_name).stem + '_'):
+            return schema
+    return None
+
+
+def read_dtypes(schema):
+    """dtype argument for pandas.read_csv, so the parser never builds generic object columns"""
+    dtypes = {col: str for col in schema['ids']}
+    dtypes.update({col: 'category' for col in schema['categories']})
+    dtypes.update({col: str for col in schema['datetimes']})
+    return dtypes
+
+
+def parse_ids(series, prefix):
+    """
+    'USR1014' -> 1014 (int32). Missing or malformed IDs (wrong prefix, not only digits) and
+    IDs the int32 form cannot hold -> UNKNOWN_ID (see _parse_ids).
+    """
+    return _parse_ids(series, prefix)[0]
+
+
+def _parse_ids(series, prefix):
+    """
+    parse_ids plus a mask of the lossy IDs: well-formed IDs that cannot round-trip through
+    int32, i.e. numbers outside the int32 range and leading zeros (USR007 would come back
+    as USR7 and merge with it). They become UNKNOWN_ID like malformed IDs.
+    """
+    text = series.astype(str)
+    digits = text.str.slice(len(prefix))
+    valid = (text.str.startswith(prefix) & digits.str.fullmatch(r'\d+')).to_numpy(dtype=bool)
+    lengths = digits.str.len().to_numpy()
+
+    leading_zero = valid & (lengths > 1) & digits.str.startswith('0').to_numpy(dtype=bool)
+    too_long = valid & (lengths > len(str(INT32_MAX)))
+    numbers = digits.where(valid & ~too_long, '0').astype(numpy.int64).to_numpy()
+    lossy = leading_zero | too_long | (numbers > INT32_MAX)
+
+    ids = pandas.Series(
+        numpy.where(valid & ~lossy, numbers, UNKNOWN_ID).astype(numpy.int32),
+        index=series.index,
+        name=series.name,
+    )
+    return ids, lossy
+
+
+def format_id(value, column):
+    """
+    Inverse of parse_ids: 1014 -> 'USR1014', UNKNOWN_ID -> 'Unknown'.
+    Values that are not parsed numbers are returned as they are.
+    """
+    if column not in ID_PREFIXES or not isinstance(value, (int, numpy.integer)):
+        return value
+    if value == UNKNOWN_ID:
+        return UNKNOWN_LABEL
+    return f"{ID_PREFIXES[column]}{value}"
+
+
+def format_ids(values, column):
+    """format_id for a list / Series of IDs"""
+    return [format_id(value, column) for value in values]
+
+
+def restore_ids(df):
+    """Copy of 'df' with the parsed ID columns formatted back to their text form (for CSV export)"""
+    df = df.copy()
+    for col, prefix in ID_PREFIXES.items():
+        if col in df.columns and pandas.api.types.is_integer_dtype(df[col]):
+            text = prefix + df[col].astype(str)
+            df[col] = text.where(df[col] != UNKNOWN_ID, UNKNOWN_LABEL)
+    return df
+
+
+def apply_schema(df, schema, coerced=None):
+    """
+    Converts the columns of 'df' in place according to 'schema'.
+    Malformed IDs and IDs that do not fit the int32 form become UNKNOWN_ID, category values
+    that are not listed in the schema become 'Unknown'. The number of rows where that happened
+    to a present value is added to 'coerced'
+    ({'coerced_ids': rows, 'lossy_ids': rows, 'coerced_categories': rows}).
+    """
+    bad_ids = numpy.zeros(len(df), dtype=bool)
+    lossy_ids = numpy.zeros(len(df), dtype=bool)
+    for col in schema['ids']:
+        if col in df.columns:
+            present = (df[col].notna() & (df[col] != UNKNOWN_LABEL)).to_numpy(dtype=bool)
+            df[col], lossy = _parse_ids(df[col], ID_PREFIXES[col])
+            bad_ids |= present & ~lossy & (df[col].to_numpy() == UNKNOWN_ID)
+            lossy_ids |= lossy
+
+    for col, fmt in schema['datetimes'].items():
+        if col in df.columns:
+            df[col] = pandas.to_datetime(df[col], format=fmt, errors='coerce')
+
+    bad_labels = numpy.zeros(len(df), dtype=bool)
+    for col, categories in schema['categories'].items():
+        if col in df.columns:
+            values = df[col]
+            if not isinstance(values.dtype, pandas.CategoricalDtype):
+                values = values.astype('category')
+            labels = categories + [UNKNOWN_LABEL]
+            bad_labels |= (values.notna() & ~values.isin(labels)).to_numpy(dtype=bool)
+            df[col] = values.cat.set_categories(labels).fillna(UNKNOWN_LABEL)
+
+    if coerced is not None:
+        for name, rows in (('coerced_ids', bad_ids), ('lossy_ids', lossy_ids),
+                           ('coerced_categories', bad_labels)):
+            coerced[name] = coerced.get(name, 0) + int(rows.sum())
+    return df
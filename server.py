@@ -0,0 +1,280 @@
+"""
+Local query server for dashboards.
+Keeps the cleaned BikeShare tables in memory and answers metric queries as JSON:
+
+    GET  /stats?start=2024-03-01&end=2024-04-01&station=ST100,ST105&user_type=member&metrics=total_trips,peak_hour
+    POST /reload     reloads the tables (and clears the result cache)
+    GET  /health
+
+Answers are cached in an LRU keyed by the normalised query parameters (parameter order, ID
+spelling and case do not matter). Aggregations run in a thread pool (pandas/NumPy release the
+GIL in their heavy loops), so the asyncio event loop keeps accepting requests meanwhile.
+Only the standard library is used for HTTP (asyncio streams, HTTP/1.1 with keep-alive).
+"""
+
+import asyncio
+import json
+import math
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy
+import pandas
+
+from analyzer import BUSINESS_STATS
+from schema import ID_PREFIXES
+
+QUERY_PARAMS = ("start", "end", "station", "user_type", "metrics")
+# bounds for open-ended date ranges
+MIN_TIME = pandas.Timestamp("1900-01-01")
+MAX_TIME = pandas.Timestamp("2200-01-01")
+
+
+class QueryError(ValueError):
+    """Invalid query parameters (answered with HTTP 400)"""
+
+
+class LRUCache:
+    """Least recently used cache of encoded answers with a fixed number of entries"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def to_json(value):
+    """Converts the stats dictionary (numpy scalars, Periods, DataFrames, NaN) to plain JSON types"""
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, pandas.DataFrame):
+        return [to_json(row) for row in value.to_dict('records')]
+    if isinstance(value, (pandas.Series, list, tuple, numpy.ndarray)):
+        return [to_json(item) for item in list(value)]
+    if isinstance(value, numpy.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class QueryService:
+    """
+    Answers metric queries against one BikeShare system.
+    The cache key contains the data generation, which is increased by every reload,
+    so answers computed from old tables are never returned or stored afterwards.
+    """
+
+    def __init__(self, system, cache_size=1024, workers=4):
+        self.system = system
+        self.cache = LRUCache(cache_size)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="citybike-query")
+        self.generation = 0
+        self._pending = {}
+        self._reload_lock = asyncio.Lock()
+        # build the lazy indexes once, before several threads read them
+        self.system.time_index
+        self.system.station_registry
+
+    @staticmethod
+    def normalise(params):
+        """Canonical, hashable form of the query parameters ({name: [values]} as from parse_qs)"""
+        unknown = set(params) - set(QUERY_PARAMS)
+        if unknown:
+            raise QueryError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+        def values(name):
+            items = [part.strip() for value in params.get(name, []) for part in value.split(",")]
+            return [item for item in items if item]
+
+        def timestamp(name):
+            items = values(name)
+            if not items:
+                return None
+            try:
+                return pandas.Timestamp(items[-1]).isoformat()
+            except ValueError:
+                raise QueryError(f"Invalid {name}: {items[-1]}") from None
+
+        metrics = set(values("metrics"))
+        unknown = metrics - set(BUSINESS_STATS)
+        if unknown:
+            raise QueryError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+
+        stations = set()
+        prefix = ID_PREFIXES['start_station_id']
+        for item in values("station"):
+            number = item[len(prefix):] if item.upper().startswith(prefix) else item
+            if not number.isdigit():
+                raise QueryError(f"Invalid station: {item}")
+            stations.add(int(number))
+
+        return (
+            ("start", timestamp("start")),
+            ("end", timestamp("end")),
+            ("station", tuple(sorted(stations))),
+            ("user_type", tuple(sorted({item.lower() for item in values("user_type")}))),
+            ("metrics", tuple(sorted(metrics))),
+        )
+
+    def select_trips(self, query):
+        """Trips matching the normalised query (time window via the sorted start_time index)"""
+        query = dict(query)
+        trips = self.system.trips
+        if query["start"] or query["end"]:
+            start = pandas.Timestamp(query["start"]) if query["start"] else MIN_TIME
+            end = pandas.Timestamp(query["end"]) if query["end"] else MAX_TIME
+            trips = self.system.trips_between(start, end)
+        if query["station"]:
+            ids = list(query["station"])
+            trips = trips[trips['start_station_id'].isin(ids) | trips['end_station_id'].isin(ids)]
+        if query["user_type"]:
+            trips = trips[trips['user_type'].isin(query["user_type"])]
+        return trips
+
+    def compute(self, query):
+        """Runs in the worker pool: filtered stats of the query as encoded JSON"""
+        trips = self.select_trips(query)
+        answer = {"trips": len(trips)}
+        if len(trips):
+            stats = self.system.generate_business_stats(trips=trips)
+            metrics = dict(query)["metrics"]
+            answer["stats"] = {name: stats[name] for name in (metrics or stats)}
+        return json.dumps(to_json(answer)).encode()
+
+    async def query(self, params):
+        """Encoded JSON answer for the query parameters, from the cache when possible"""
+        query = self.normalise(params)
+        key = (self.generation, query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # identical queries that arrive while one is computed wait for the same result
+        pending = self._pending.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(self.pool, self.compute, query)
+            self._pending[key] = pending
+            try:
+                body = await pending
+            finally:
+                self._pending.pop(key, None)
+            if key[0] == self.generation:
+                self.cache.put(key, body)
+            return body
+        return await asyncio.shield(pending)
+
+    async def reload(self, use_cache=True):
+        """Loads the tables again in the pool and invalidates all cached answers"""
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.pool, lambda: self.system.initialize_system(use_cache=use_cache))
+            await loop.run_in_executor(self.pool, lambda: (self.system.time_index, self.system.station_registry))
+            self.generation += 1
+            self.cache.clear()
+
+    def health(self):
+        return json.dumps({"status": "ok", "trips": len(self.system.trips), "generation": self.generation,
+                           "cached": len(self.cache), "cache_hits": self.cache.hits,
+                           "cache_misses": self.cache.misses}).encode()
+
+
+class StatsServer:
+    """Minimal asyncio HTTP/1.1 front end of a QueryService"""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                parts = request_line.decode("latin-1").split()
+                method, target = (parts[0], parts[1]) if len(parts) >= 2 else ("", "/")
+                status, body = await self.respond(method, target)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                             b"Connection: %s\r\n\r\n" % (status, STATUS_TEXT[status].encode(), len(body),
+                                                           b"keep-alive" if keep_alive else b"close") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target):
+        url = urlsplit(target)
+        try:
+            if url.path == "/stats" and method == "GET":
+                return 200, await self.service.query(parse_qs(url.query))
+            if url.path == "/reload" and method == "POST":
+                await self.service.reload()
+                return 200, self.service.health()
+            if url.path == "/health" and method == "GET":
+                return 200, self.service.health()
+            return 404, json.dumps({"error": f"Not found: {method} {url.path}"}).encode()
+        except QueryError as e:
+            return 400, json.dumps({"error": str(e)}).encode()
+        except Exception as e:  # the server keeps running, the client gets the error
+            return 500, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def serve(system, host="127.0.0.1", port=8080, cache_size=1024, workers=4):
+    """Runs the query server until it is interrupted (Ctrl+C)"""
+    async def run():
+        server = await StatsServer(QueryService(system, cache_size, workers)).start(host, port)
+        print(f"Query server listening on http://{host}:{port}/stats (Ctrl+C to stop)")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,95 @@
+"""
+Sorted indexes over columns of the trips table.
+Range queries (time windows, distance bands) are answered with binary searches
+instead of full-table boolean masks.
+"""
+
+import numpy
+import pandas
+
+from algorithms import Algorithms
+
+
+class SortedColumnIndex:
+    """
+    Rows of a table sorted by one column.
+    'order' holds the row positions in sorted order and 'keys' the matching values,
+    so every range is a contiguous slice found with two binary searches.
+    """
+
+    def __init__(self, df, column):
+        self.df = df
+        self.column = column
+        self.is_datetime = pandas.api.types.is_datetime64_any_dtype(df[column])
+        values = self._to_keys(df[column])
+        order = Algorithms.argsort(values)
+        # missing values (NaN/NaT) are sorted to the end and never match a range
+        valid = ~pandas.isna(values[order])
+        self.order = order[valid]
+        self.keys = values[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def _to_keys(self, values):
+        if self.is_datetime:
+            return numpy.asarray(pandas.to_datetime(values), dtype='datetime64[ns]')
+        return numpy.asarray(values)
+
+    def window(self, low, high, include_high=True):
+        """Row positions with low <= value <= high (value < high with include_high=False), sorted by value"""
+        positions, _ = self.windows([low], [high], include_high)
+        return positions
+
+    def windows(self, lows, highs, include_high=True):
+        """
+        Row positions for many ranges at once (one vectorised searchsorted).
+        Returns the positions of all ranges concatenated and the number of rows per range.
+        """
+        lows = self._to_keys(lows)
+        highs = self._to_keys(highs)
+        lo, hi = Algorithms.batch_range_query(self.keys, lows, highs, include_high)
+        counts = hi - lo
+        total = int(counts.sum())
+        if not total:
+            return numpy.empty(0, dtype=self.order.dtype), counts
+
+        # expand every (lo, hi) slice to its positions without a Python loop
+        offsets = numpy.repeat(lo - numpy.concatenate([[0], numpy.cumsum(counts)[:-1]]), counts)
+        return self.order[numpy.arange(total) + offsets], counts
+
+    def select(self, positions):
+        """Rows of the table for positions returned by window/windows/query"""
+        return self.df.iloc[positions]
+
+
+class TripTimeIndex(SortedColumnIndex):
+    """Trips sorted by a datetime column (start_time by default), with calendar queries"""
+
+    def __init__(self, trips, column='start_time'):
+        super().__init__(trips, column)
+
+    def query(self, start, end, hours=None, weekdays=None):
+        """
+        Row positions of trips between 'start' and 'end' (end exclusive), optionally only
+        within a daily hour window hours=(from_hour, to_hour) and on some weekdays (0 = Monday).
+        Example: trips between 08:00 and 09:00 on weekdays in March
+            query('2024-03-01', '2024-04-01', hours=(8, 9), weekdays=range(5))
+        Every matching day is one window, so the cost is O(days * log(trips)) plus the result size.
+        """
+        start = pandas.Timestamp(start).as_unit('ns')
+        end = pandas.Timestamp(end).as_unit('ns')
+        if hours is None and weekdays is None:
+            return self.window(start, end, include_high=False)
+
+        days = pandas.date_range(start.normalize(), end, freq='D')
+        if weekdays is not None:
+            days = days[days.weekday.isin(list(weekdays))]
+
+        from_hour, to_hour = hours if hours is not None else (0, 24)
+        # the first and the last day are clipped to [start, end)
+        lows = numpy.maximum((days + pandas.Timedelta(hours=from_hour)).as_unit('ns').to_numpy(), start.to_datetime64())
+        highs = numpy.minimum((days + pandas.Timedelta(hours=to_hour)).as_unit('ns').to_numpy(), end.to_datetime64())
+        keep = lows < highs
+        positions, _ = self.windows(lows[keep], highs[keep], include_high=False)
+        return positions
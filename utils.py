@@ -0,0 +1,114 @@
+"""
+Helper utility functions.
+Only standard library imports here, so the CLI can use it before pandas is loaded.
+"""
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where the OS does not report it)"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_rss_peak():
+    """
+    Resets the RSS high-water mark (VmHWM) of this process, so rss_peak_mb() reports the
+    peak since this call. Returns False where that is not supported (only Linux has it);
+    ru_maxrss (peak_rss_mb) is never reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def rss_peak_mb():
+    """RSS high-water mark since the last reset_rss_peak() in MB (None without /proc)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class StepProfiler:
+    """
+    Measures wall time and peak memory of named steps.
+    - peak RSS: high-water mark of the resident memory of the process during the step.
+      Nearly free; it is reset before every step on Linux, elsewhere it is the peak of
+      the process so far (see reset_rss_peak).
+    - peak traced (trace_memory=True): peak Python/NumPy allocations from tracemalloc.
+      More detailed, but tracemalloc slows allocation-heavy code down a lot.
+    When disabled, step() does nothing, so it can stay in the code.
+    close() (or leaving a 'with StepProfiler(...)' block) stops tracemalloc again if this
+    profiler started it, so later code is not slowed down.
+    """
+
+    def __init__(self, enabled=False, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        # (name, seconds, traced peak MB or None, RSS peak MB or None) per step
+        self.steps = []
+        self._rss_resets = True
+        self._started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def step(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self._rss_resets = reset_rss_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20 if self.trace_memory else None
+            rss_mb = rss_peak_mb() if self._rss_resets else peak_rss_mb()
+            self.steps.append((name, elapsed, peak_mb, rss_mb))
+
+    def report(self):
+        """Table of all measured steps as text"""
+        lines = ["", "PROFILE", f"{'step':<12}{'wall time':>12}{'peak RSS':>14}{'peak traced':>14}"]
+        for name, elapsed, peak_mb, rss_mb in self.steps:
+            rss = f"{rss_mb:>11.1f} MB" if rss_mb is not None else f"{'-':>14}"
+            traced = f"{peak_mb:>11.1f} MB" if peak_mb is not None else f"{'-':>14}"
+            lines.append(f"{name:<12}{elapsed:>11.3f}s{rss}{traced}")
+        if not self._rss_resets:
+            lines.append("(peak RSS is the peak of the process up to the end of the step)")
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines.append(f"peak RSS of the process: {rss:.1f} MB")
+        return "\n".join(lines)
@@ -1,55 +1,238 @@
-import matplotlib.pyplot as plt
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
+from matplotlib.figure import Figure
+
+from aggregation import TripAggregates, top_counts
+from cube import RollupCube
+from metrics import METRICS
+from registry import StationRegistry
+
+# bump when the look of the charts changes, so cached charts are drawn again
+CHART_VERSION = 3
+# box plots never get more outlier points than this
+MAX_FLIERS = 500
+
+
+def bike_type_counts(trips_df):
+    counts = trips_df['bike_type'].value_counts()
+    # categorical columns also count the unused categories (e.g. 'Unknown') with 0
+    counts = counts[counts > 0]
+    return {"labels": [str(label) for label in counts.index], "counts": counts.tolist()}
+
+
+def hour_counts(trips_df, **where):
+    """Trips per hour; 'trips_df' can also be a RollupCube, then 'where' filters it (see RollupCube.select)"""
+    if isinstance(trips_df, RollupCube):
+        counts = trips_df.by('hour', **where)
+        counts = counts[counts > 0]
+    else:
+        counts = trips_df['start_time'].dt.hour.value_counts().sort_index()
+    return {"hours": [int(h) for h in counts.index], "counts": counts.tolist()}
+
+
+def top_station_counts(trips_df, registry, n=10):
+    top_stations = trips_df['start_station_id'].value_counts().head(n)
+    # Map IDs to names for the chart (one vectorised lookup instead of a scan per ID)
+    return {"names": registry.names_for(top_stations.index), "counts": top_stations.tolist()}
+
+
+def box_stats(values=None, quantiles=None, label='', whis=1.5):
+    """
+    Box plot statistics (the input of Axes.bxp), so the raw data never reaches matplotlib.
+    Either 'values' (array/Series, one vectorised pass for the whiskers and outliers) or,
+    opt-in, 'quantiles' = StreamingStats / dict with q1, median, q3, min, max (no pass over
+    the data). A StreamingStats gives approximate whiskers and outliers from its t-digest
+    centroids (the tails are near single values); a dict only clips the whiskers to the
+    1.5 IQR range and has no outliers.
+    Returns None when there are no values.
+    """
+    if values is None:
+        if hasattr(quantiles, "quantile"):
+            if not quantiles.count:
+                return None
+            q1, med, q3 = quantiles.quantile([0.25, 0.5, 0.75])
+            # centroid means plus the exact extremes stand in for the data points
+            points = np.concatenate([[quantiles.min], quantiles.centroids, [quantiles.max]])
+        else:
+            q1, med, q3 = quantiles["q1"], quantiles["median"], quantiles["q3"]
+            low, high = q1 - whis * (q3 - q1), q3 + whis * (q3 - q1)
+            return {"label": label, "q1": float(q1), "med": float(med), "q3": float(q3),
+                    "whislo": float(max(quantiles["min"], low)), "whishi": float(min(quantiles["max"], high)),
+                    "fliers": []}
+    else:
+        points = np.asarray(values, dtype=np.float64)
+        points = points[~np.isnan(points)]
+        if not points.size:
+            return None
+        q1, med, q3 = np.percentile(points, [25, 50, 75])
+
+    low, high = q1 - whis * (q3 - q1), q3 + whis * (q3 - q1)
+    inside = points[(points >= low) & (points <= high)]
+    fliers = np.sort(points[(points < low) | (points > high)])
+    if len(fliers) > MAX_FLIERS:
+        fliers = fliers[np.linspace(0, len(fliers) - 1, MAX_FLIERS).astype(np.int64)]
+    whislo, whishi = (inside.min(), inside.max()) if inside.size else (q1, q3)
+
+    return {"label": label, "q1": float(q1), "med": float(med), "q3": float(q3),
+            "whislo": float(whislo), "whishi": float(whishi), "fliers": fliers.tolist()}
+
+
+# --- Renderers: object-oriented Figure API only (no pyplot state), safe in threads and processes ---
+
+def render_bike_types(data, path):
+    """1. Pie chart of bike types (Classic vs Electric)"""
+    fig = Figure(figsize=(8, 6))
+    ax = fig.add_subplot()
+    ax.pie(data["counts"], labels=data["labels"], autopct='%1.1f%%', colors=['skyblue', 'orange'])
+    ax.set_title('Distribution of Bike Types')
+    fig.savefig(path)
+
+
+def render_peak_hours(data, path):
+    """2. Bar chart of rentals per hour"""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    ax.bar([str(h) for h in data["hours"]], data["counts"], color='green')
+    ax.set_title('Peak Rental Hours')
+    ax.set_xlabel('Hour of the Day')
+    ax.set_ylabel('Number of Trips')
+    fig.savefig(path)
+
+
+def render_top_stations(data, path):
+    """3. Horizontal bar chart of Top 10 Stations"""
+    fig = Figure(figsize=(10, 8))
+    ax = fig.add_subplot()
+    ax.barh(data["names"], data["counts"], color='purple')
+    ax.set_title('Top 10 Most Popular Start Stations')
+    ax.set_xlabel('Number of Trips')
+    ax.invert_yaxis() # Highest on top
+    fig.savefig(path)
+
+
+def render_trip_distances(data, path):
+    """4. Box plot of trip distances from precomputed box statistics (box_stats)"""
+    fig = Figure(figsize=(8, 6))
+    ax = fig.add_subplot()
+    ax.bxp([data])
+    ax.set_title('Trip Distance Distribution')
+    ax.set_ylabel('Distance (km)')
+    fig.savefig(path)
+
+
+CHARTS = {
+    "bike_types": ("bike_types_dist.png", render_bike_types),
+    "peak_hours": ("peak_hours.png", render_peak_hours),
+    "top_stations": ("top_stations.png", render_top_stations),
+    "trip_distances": ("distance_boxplot.png", render_trip_distances),
+}
+
+
+def _render_chart(name, data, path):
+    CHARTS[name][1](data, path)
+    return name
+
+
 class Visualizer:
     """
     Handles data visualization using Matplotlib.
     Generates and saves charts to the output directory.
+    Every chart is drawn from a small aggregate; render_all draws them in parallel and
+    skips charts whose aggregate did not change since the last run.
     """
-    
+
     def __init__(self, output_path="output/figures"):
         self.output_path = Path(output_path)
         # Create directory if it doesn't exist
         self.output_path.mkdir(parents=True, exist_ok=True)
+        self.hash_file = self.output_path / ".chart_hashes.json"
+
+    def chart_aggregates(self, trips_df, stations_df, registry=None, distance_quantiles=None, aggregates=None):
+        """
+        Small inputs of all charts, taken from the TripAggregates of the trips ('aggregates',
+        e.g. BikeShare.trip_aggregates, which the report uses too; computed here if missing).
+        The distance box plot is computed from the distances, with the real whiskers and
+        outliers; passing 'distance_quantiles' (or no trips) switches it to the approximate
+        quartile mode of box_stats. A chart without data gets None.
+        """
+        registry = registry or StationRegistry(stations_df)
+        if aggregates is None:
+            aggregates = TripAggregates.from_trips(trips_df)
+        hours = aggregates.hour_counts().sort_index()
+        top_stations = top_counts(aggregates.station_counts(level=0), 10)
+        bike_types = aggregates.bike_type_trips
+        if distance_quantiles is None and trips_df is not None:
+            distances = box_stats(trips_df['distance_km'])
+        else:
+            distances = box_stats(quantiles=distance_quantiles if distance_quantiles is not None
+                                  else aggregates.distance_stats)
+        return {
+            "bike_types": {"labels": list(bike_types.index), "counts": bike_types.tolist()} if len(bike_types) else None,
+            "peak_hours": {"hours": [int(h) for h in hours.index], "counts": hours.tolist()} if len(hours) else None,
+            "top_stations": {"names": registry.names_for(top_stations.index), "counts": top_stations.tolist()}
+                            if len(top_stations) else None,
+            "trip_distances": distances,
+        }
+
+    def render_all(self, trips_df, stations_df, registry=None, workers=None, use_processes=True,
+                   distance_quantiles=None, force=False, aggregates=None):
+        """
+        Draws all charts in a worker pool. A chart is skipped when the hash of its
+        aggregate is the same as in the last run and the image still exists.
+        Charts without data are not drawn.
+        Returns {chart name: 'rendered' | 'skipped' | 'no data'}.
+        """
+        with METRICS.timer("chart_aggregates"):
+            aggregates = self.chart_aggregates(trips_df, stations_df, registry, distance_quantiles, aggregates)
+        old_hashes = json.loads(self.hash_file.read_text()) if self.hash_file.exists() else {}
+
+        hashes = {}
+        todo = {}
+        empty = {name for name, data in aggregates.items() if data is None}
+        for name, data in aggregates.items():
+            if name in empty:
+                continue
+            hashes[name] = self._hash(name, data)
+            path = self.output_path / CHARTS[name][0]
+            if force or old_hashes.get(name) != hashes[name] or not path.exists():
+                todo[name] = (data, path)
+
+        if todo:
+            pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            with METRICS.timer("render_charts"), \
+                    pool_class(max_workers=workers or len(todo)) as pool:
+                futures = [pool.submit(_render_chart, name, data, path) for name, (data, path) in todo.items()]
+                for future in futures:
+                    future.result()
+
+        self.hash_file.write_text(json.dumps(hashes, indent=2))
+        return {name: ("no data" if name in empty else "rendered" if name in todo else "skipped")
+                for name in aggregates}
+
+    @staticmethod
+    def _hash(name, data):
+        payload = json.dumps({"chart": name, "version": CHART_VERSION, "data": data}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
 
     def plot_bike_types(self, trips_df):
         """1. Pie chart of bike types (Classic vs Electric)"""
-        plt.figure(figsize=(8, 6))
-        trips_df['bike_type'].value_counts().plot(kind='pie', autopct='%1.1f%%', colors=['skyblue', 'orange'])
-        plt.title('Distribution of Bike Types')
-        plt.ylabel('')
-        plt.savefig(self.output_path / "bike_types_dist.png")
-        plt.close()
-
-    def plot_peak_hours(self, trips_df):
-        """2. Bar chart of rentals per hour"""
-        plt.figure(figsize=(10, 6))
-        trips_df['start_time'].dt.hour.value_counts().sort_index().plot(kind='bar', color='green')
-        plt.title('Peak Rental Hours')
-        plt.xlabel('Hour of the Day')
-        plt.ylabel('Number of Trips')
-        plt.savefig(f"{self.output_path}/peak_hours.png")
-        plt.close()
-
-    def plot_top_stations(self, trips_df, stations_df):
+        render_bike_types(bike_type_counts(trips_df), self.output_path / "bike_types_dist.png")
+
+    def plot_peak_hours(self, trips_df, **where):
+        """2. Bar chart of rentals per hour (from trips or a filtered RollupCube, e.g. user_type='member')"""
+        render_peak_hours(hour_counts(trips_df, **where), self.output_path / "peak_hours.png")
+
+    def plot_top_stations(self, trips_df, stations_df, registry=None):
         """3. Horizontal bar chart of Top 10 Stations"""
-        plt.figure(figsize=(10, 8))
-        top_stations = trips_df['start_station_id'].value_counts().head(10)
-        # Map IDs to names for the chart
-        names = [stations_df[stations_df['station_id'] == sid]['station_name'].values[0] for sid in top_stations.index]
-        
-        plt.barh(names, top_stations.values, color='purple')
-        plt.title('Top 10 Most Popular Start Stations')
-        plt.xlabel('Number of Trips')
-        plt.gca().invert_yaxis() # Highest on top
-        plt.savefig(f"{self.output_path}/top_stations.png")
-        plt.close()
+        registry = registry or StationRegistry(stations_df)
+        render_top_stations(top_station_counts(trips_df, registry), self.output_path / "top_stations.png")
 
     def plot_trip_distances(self, trips_df):
-        """4. Box plot of trip distances to see outliers"""
-        plt.figure(figsize=(8, 6))
-        plt.boxplot(trips_df['distance_km'])
-        plt.title('Trip Distance Distribution')
-        plt.ylabel('Distance (km)')
-        plt.savefig(f"{self.output_path}/distance_boxplot.png")
-        plt.close()
\ No newline at end of file
+        """4. Box plot of trip distances to see outliers (nothing is drawn without distances)"""
+        data = box_stats(trips_df['distance_km'])
+        if data is not None:
+            render_trip_distances(data, self.output_path / "distance_boxplot.png")